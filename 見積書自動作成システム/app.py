@@ -2,73 +2,193 @@
 AI見積書生成システム - Flaskアプリケーション
 Webインターフェースを提供し、各機能を統合
 """
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response
 import sqlite3
 import json
 from datetime import datetime
 import os
+import glob
+import time
+import hashlib
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from werkzeug.utils import secure_filename
-from database_setup import EstimateDatabase
+from database_setup import EstimateDatabase, apply_connection_pragmas
 from geocoding_distance import GeocodingService
 from price_prediction import PricePredictionModel
 from estimate_generator import EstimateGenerator
-from import_from_pdf import PDFEstimateImporter
+from import_from_pdf import PDFEstimateImporter, parse_pdf_estimate_file
 from distance_pricing import DistancePricingService
 
 app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max
 
-# アップロードフォルダを作成
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-
-# サービスの初期化
-geocoding_service = GeocodingService()
-price_predictor = PricePredictionModel()
-estimate_generator = EstimateGenerator()
-distance_pricing_service = DistancePricingService()
-
-# 価格予測モデルをロード
-try:
-    price_predictor.load_model()
-except:
-    print("[警告] 価格予測モデルが読み込めません。モデルを訓練してください。")
+# サービス（init_services で1回だけ初期化する）
+# Windows等のspawn方式ではPDF解析のワーカープロセスがこのモジュールを再読み込みするため、
+# import時にはモデル読み込みなどの重い初期化を行わない
+geocoding_service = None
+price_predictor = None
+estimate_generator = None
+distance_pricing_service = None
+_services_lock = threading.Lock()
+_services_ready = False
 
 DB_NAME = "estimate_system.db"
 
 def get_db_connection():
-    """データベース接続を取得"""
-    conn = sqlite3.connect(DB_NAME)
+    """
+    データベース接続を取得
+
+    暗黙のトランザクションは使用しない（isolation_level=None）。
+    複数の書き込みは BEGIN IMMEDIATE ～ COMMIT で明示的にまとめること。
+    """
+    conn = sqlite3.connect(DB_NAME, isolation_level=None)
+    apply_connection_pragmas(conn)
     conn.row_factory = sqlite3.Row
     return conn
 
+# リクエスト間で再利用するスレッドごとの接続
+_db_local = threading.local()
+
+def get_db():
+    """スレッドごとに保持した接続を取得（初回のみ接続を作成）"""
+    conn = getattr(_db_local, 'conn', None)
+    if conn is None:
+        conn = get_db_connection()
+        _db_local.conn = conn
+    return conn
+
+@app.teardown_appcontext
+def release_db(exception):
+    """リクエスト終了時に未確定のトランザクションを破棄（接続は閉じずに再利用）"""
+    conn = getattr(_db_local, 'conn', None)
+    if conn is not None and conn.in_transaction:
+        conn.rollback()
+
+# 一覧APIのレスポンスキャッシュ（TTL内はSQLiteへの問い合わせとJSON変換を省略）
+LIST_CACHE_TTL = 60  # 秒
+_list_cache = {}
+_list_cache_versions = {'customers': 0, 'products': 0}
+_list_cache_lock = threading.Lock()
+
+def invalidate_list_cache(*names):
+    """一覧キャッシュを無効化（データ更新後に呼び出す）"""
+    with _list_cache_lock:
+        for name in names:
+            _list_cache_versions[name] += 1
+            _list_cache.pop(name, None)
+
+def query_json(query, params=()):
+    """クエリ結果をオブジェクト配列のJSONバイト列で返す"""
+    cursor = get_db().cursor()
+    cursor.row_factory = None  # sqlite3.Row を生成せずタプルのまま受け取る
+    cursor.execute(query, params)
+    columns = [description[0] for description in cursor.description]
+    return app.json.dumps([dict(zip(columns, row)) for row in cursor]).encode('utf-8')
+
+def cached_list_response(name, query):
+    """一覧をJSONで返す（TTLキャッシュ付き、ETag一致時は304を返す）"""
+    entry = _list_cache.get(name)
+
+    if (entry is None
+            or entry['version'] != _list_cache_versions[name]
+            or time.monotonic() - entry['ts'] > LIST_CACHE_TTL):
+        version = _list_cache_versions[name]
+        body = query_json(query)
+        entry = {
+            'ts': time.monotonic(),
+            'version': version,
+            'etag': hashlib.blake2b(body, digest_size=8).hexdigest(),
+            'body': body,
+        }
+        with _list_cache_lock:
+            # 取得中に無効化された場合は古いデータを保存しない
+            if version == _list_cache_versions[name]:
+                _list_cache[name] = entry
+
+    response = Response(entry['body'], mimetype='application/json')
+    response.set_etag(entry['etag'])
+    return response.make_conditional(request)
+
+def prerender_template(template_name):
+    """動的な値を持たないテンプレートを一度だけ描画（本文とETagを返す）"""
+    with app.test_request_context('/'):
+        body = render_template(template_name).encode('utf-8')
+    return body, hashlib.blake2b(body, digest_size=8).hexdigest()
+
+def static_html_response(body, etag):
+    """描画済みHTMLを返す（ETag一致時は304を返す）"""
+    response = Response(body, mimetype='text/html')
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+# 起動時に描画したページ（init_services で設定）
+INDEX_HTML = INDEX_ETAG = None
+TEST_HTML = TEST_ETAG = None
+
+def init_services():
+    """サービスの生成・価格予測モデルの読み込み・ページの事前描画を1回だけ行う"""
+    global geocoding_service, price_predictor, estimate_generator, distance_pricing_service
+    global INDEX_HTML, INDEX_ETAG, TEST_HTML, TEST_ETAG, _services_ready
+
+    if _services_ready:
+        return
+
+    with _services_lock:
+        if _services_ready:
+            return
+
+        geocoding_service = GeocodingService(db_name="estimate_system.db")
+        price_predictor = PricePredictionModel()
+        estimate_generator = EstimateGenerator()
+        distance_pricing_service = DistancePricingService()
+
+        # 価格予測モデルをロード
+        try:
+            if price_predictor.load_model():
+                # 初回予測の準備コストをリクエスト処理の外で済ませる
+                price_predictor.predict("warmup", 1)
+        except:
+            print("[警告] 価格予測モデルが読み込めません。モデルを訓練してください。")
+
+        INDEX_HTML, INDEX_ETAG = prerender_template('index.html')
+        TEST_HTML, TEST_ETAG = prerender_template('test.html')
+
+        _services_ready = True
+
+@app.before_request
+def ensure_services():
+    """WSGIサーバーから読み込まれた場合は最初のリクエスト時に初期化"""
+    init_services()
+
 @app.route('/')
 def index():
     """トップページ"""
-    return render_template('index.html')
+    return static_html_response(INDEX_HTML, INDEX_ETAG)
 
 @app.route('/test')
 def test():
     """API接続テストページ"""
-    return render_template('test.html')
+    return static_html_response(TEST_HTML, TEST_ETAG)
 
 @app.route('/api/customers', methods=['GET'])
 def get_customers():
     """顧客一覧を取得"""
-    conn = get_db_connection()
-    customers = conn.execute('SELECT * FROM customers').fetchall()
-    conn.close()
-
-    return jsonify([dict(row) for row in customers])
+    # 画面で使用するカラムのみ取得
+    return cached_list_response('customers', '''
+        SELECT customer_id, company_name, address, distance_km, phone, email
+        FROM customers
+    ''')
 
 @app.route('/api/products', methods=['GET'])
 def get_products():
     """商品一覧を取得"""
-    conn = get_db_connection()
-    products = conn.execute('SELECT * FROM products').fetchall()
-    conn.close()
-
-    return jsonify([dict(row) for row in products])
+    # 画面で使用するカラムのみ取得
+    return cached_list_response('products', '''
+        SELECT product_id, product_name, product_category, base_price, unit
+        FROM products
+    ''')
 
 @app.route('/api/customer', methods=['POST'])
 def add_customer():
@@ -80,29 +200,29 @@ def add_customer():
     phone = data.get('phone')
     email = data.get('email')
 
-    # 住所から座標を取得
-    coordinates = geocoding_service.geocode_address(address)
-
     latitude = None
     longitude = None
     distance_km = None
 
+    # 住所から座標を取得（キャッシュ済みの住所はAPIを呼ばない）
+    coordinates = geocoding_service.geocode_address(address)
+
     if coordinates:
         latitude, longitude = coordinates
         distance_km = geocoding_service.get_distance_from_base(latitude, longitude)
 
     # データベースに登録
-    conn = get_db_connection()
+    conn = get_db()
     cursor = conn.cursor()
-
+    cursor.execute('BEGIN IMMEDIATE')
     cursor.execute('''
         INSERT INTO customers (company_name, address, latitude, longitude, distance_km, phone, email)
         VALUES (?, ?, ?, ?, ?, ?, ?)
     ''', (company_name, address, latitude, longitude, distance_km, phone, email))
 
     customer_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    cursor.execute('COMMIT')
+    invalidate_list_cache('customers')
 
     return jsonify({
         'success': True,
@@ -130,6 +250,38 @@ def predict_price():
             'error': str(e)
         })
 
+@app.route('/api/predict_prices', methods=['POST'])
+def predict_prices():
+    """複数商品の価格をまとめて予測"""
+    data = request.json
+
+    items = data.get('items', [])  # [{'product_name': '', 'quantity': 1}, ...]
+
+    try:
+        product_names = [item.get('product_name') for item in items]
+        quantities = [int(item.get('quantity', 1)) for item in items]
+
+        predicted_prices = price_predictor.predict_batch(product_names, quantities)
+        return jsonify({
+            'success': True,
+            'predicted_prices': [int(price) for price in predicted_prices]
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        })
+
+def _parse_amount(value) -> int:
+    """明細の金額を整数に変換（小数部のある値は切り捨てずにエラーとする）"""
+    if isinstance(value, int):
+        return value
+
+    number = float(value)
+    if not number.is_integer():
+        raise ValueError(f"整数ではありません: {value}")
+    return int(number)
+
 @app.route('/api/generate_estimate', methods=['POST'])
 def generate_estimate():
     """見積書を生成"""
@@ -140,45 +292,64 @@ def generate_estimate():
     notes = data.get('notes', '')
 
     # 顧客情報を取得
-    conn = get_db_connection()
+    conn = get_db()
     customer = conn.execute('SELECT * FROM customers WHERE customer_id = ?', (customer_id,)).fetchone()
 
     if not customer:
         return jsonify({'success': False, 'error': '顧客が見つかりません'})
 
+    # 金額は文字列で届く場合もあるため一度だけ数値に変換して再利用（PDF生成にも使用）
+    try:
+        amounts = [_parse_amount(item['amount']) for item in items]
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': f'金額が不正です: {e}'})
+    total_amount = sum(amounts)
+
     # 見積番号を生成
-    estimate_number = f"EST-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+    estimate_number = f"EST-{datetime.now():%Y%m%d-%H%M%S}"
 
     # 見積書をデータベースに保存
-    total_amount = sum(item['amount'] for item in items)
 
+    # 見積ヘッダーと明細を1トランザクションで登録
     cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    # estimate_date はテーブルの既定値（現在日時）を使用
     cursor.execute('''
-        INSERT INTO estimates (customer_id, estimate_date, total_amount, status, notes)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (customer_id, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), total_amount, 'draft', notes))
+        INSERT INTO estimates (customer_id, total_amount, status, notes)
+        VALUES (?, ?, ?, ?)
+    ''', (customer_id, total_amount, 'draft', notes))
 
     estimate_id = cursor.lastrowid
 
+    # 商品IDを商品名からまとめて取得（明細ごとの検索を避ける）
+    product_names = list({item['name'] for item in items})
+    placeholders = ','.join('?' * len(product_names))
+    product_rows = conn.execute(
+        f'SELECT product_name, product_id FROM products WHERE product_name IN ({placeholders}) ORDER BY product_id',
+        product_names
+    ).fetchall()
+    product_ids = {}
+    for row in product_rows:
+        product_ids.setdefault(row['product_name'], row['product_id'])
+
     # 見積明細を保存
-    for item in items:
-        # 商品IDを取得（商品名から検索）
-        product = conn.execute('SELECT product_id FROM products WHERE product_name = ?', (item['name'],)).fetchone()
-        product_id = product['product_id'] if product else None
+    detail_rows = [
+        (estimate_id, product_ids.get(item['name']), item['quantity'], item['unit_price'], amount, item.get('notes', ''))
+        for item, amount in zip(items, amounts)
+    ]
 
-        cursor.execute('''
-            INSERT INTO estimate_details (estimate_id, product_id, quantity, unit_price, amount, notes)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (estimate_id, product_id, item['quantity'], item['unit_price'], item['amount'], item.get('notes', '')))
+    cursor.executemany('''
+        INSERT INTO estimate_details (estimate_id, product_id, quantity, unit_price, amount, notes)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', detail_rows)
 
-    conn.commit()
-    conn.close()
+    cursor.execute('COMMIT')
 
-    # PDFを生成
+    # PDFを生成（リクエストの明細は変更せず、変換済みの金額を持つコピーを渡す）
     pdf_path = estimate_generator.generate_estimate(
         customer_name=customer['company_name'],
         customer_address=customer['address'],
-        items=items,
+        items=[{**item, 'amount': amount} for item, amount in zip(items, amounts)],
         estimate_number=estimate_number,
         notes=notes
     )
@@ -193,20 +364,74 @@ def generate_estimate():
 @app.route('/api/estimates', methods=['GET'])
 def get_estimates():
     """見積一覧を取得"""
-    conn = get_db_connection()
-    estimates = conn.execute('''
+    body = query_json('''
         SELECT e.*, c.company_name
         FROM estimates e
         JOIN customers c ON e.customer_id = c.customer_id
         ORDER BY e.created_at DESC
-    ''').fetchall()
-    conn.close()
+    ''')
+
+    return Response(body, mimetype='application/json')
+
+# PDF取り込みを実行するバックグラウンドスレッドと処理状況
+_io_pool = ThreadPoolExecutor(max_workers=4)
+_upload_jobs = {}
+_upload_jobs_lock = threading.Lock()
+
+# 完了したジョブの結果を保持する時間（秒）。状況を取得されないジョブはこの時間を過ぎたら破棄
+UPLOAD_JOB_TTL = 600
+_upload_finished_at = {}  # job_id -> 完了時刻（time.monotonic）
 
-    return jsonify([dict(row) for row in estimates])
+def _prune_upload_jobs():
+    """保持期間を過ぎた完了ジョブを破棄"""
+    expire_before = time.monotonic() - UPLOAD_JOB_TTL
+    with _upload_jobs_lock:
+        expired = [job_id for job_id, finished_at in _upload_finished_at.items() if finished_at < expire_before]
+        for job_id in expired:
+            _upload_jobs.pop(job_id, None)
+            _upload_finished_at.pop(job_id, None)
+
+def _import_uploaded_pdf(job_id, filename, pdf_bytes):
+    """アップロードされたPDFから顧客・商品を登録（バックグラウンドで実行）"""
+    print(f"[PDF] 取り込み開始: {filename} ({job_id})")
+
+    try:
+        # PDFから情報を抽出（ファイルには保存せずメモリ上で解析）
+        importer = PDFEstimateImporter(DB_NAME)
+        importer.connect(get_db_connection())
+
+        try:
+            data = importer.parse_pdf_estimate(pdf_bytes)
+
+            if not data:
+                result = {'success': False, 'error': 'PDFの解析に失敗しました'}
+            else:
+                # 顧客・商品をまとめて登録
+                importer.conn.execute('BEGIN IMMEDIATE')
+                counts = importer.bulk_import([data])
+                importer.conn.commit()
+                invalidate_list_cache('customers', 'products')
+
+                result = {
+                    'success': True,
+                    'customers_added': counts['customers'],
+                    'products_added': counts['products'],
+                    'customer_name': data.get('customer_name'),
+                    'total_products': len(data['products'])
+                }
+        finally:
+            importer.close()
+
+    except Exception as e:
+        result = {'success': False, 'error': str(e)}
+
+    with _upload_jobs_lock:
+        _upload_jobs[job_id] = {'status': 'done', **result}
+        _upload_finished_at[job_id] = time.monotonic()
 
 @app.route('/api/upload_pdf', methods=['POST'])
 def upload_pdf():
-    """PDFファイルをアップロードして顧客・商品を登録"""
+    """PDFファイルをアップロードして顧客・商品を登録（取り込みはバックグラウンドで実行）"""
     if 'file' not in request.files:
         return jsonify({'success': False, 'error': 'ファイルが選択されていません'})
 
@@ -219,56 +444,37 @@ def upload_pdf():
         return jsonify({'success': False, 'error': 'PDFファイルを選択してください'})
 
     try:
-        # ファイルを保存
+        # アップロード内容はディスクに保存せずバイト列のまま解析に渡す
+        job_id = uuid.uuid4().hex
         filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        pdf_bytes = file.read()
 
-        # PDFから情報を抽出
-        importer = PDFEstimateImporter(DB_NAME)
-        importer.connect()
+        # 新しいジョブを登録する際に、取得されずに残った古い結果を破棄
+        _prune_upload_jobs()
+        with _upload_jobs_lock:
+            _upload_jobs[job_id] = {'status': 'processing'}
+        _io_pool.submit(_import_uploaded_pdf, job_id, filename, pdf_bytes)
 
-        data = importer.parse_pdf_estimate(filepath)
+        return jsonify({'success': True, 'status': 'processing', 'job_id': job_id}), 202
 
-        if not data:
-            importer.close()
-            return jsonify({'success': False, 'error': 'PDFの解析に失敗しました'})
-
-        customers_added = 0
-        products_added = 0
-
-        # 顧客を登録
-        if data['customer_name']:
-            customer_id = importer.import_customer(data['customer_name'], data['address'])
-            if customer_id:
-                customers_added = 1
-
-        # 商品を登録
-        for product in data['products']:
-            product_id = importer.import_product(
-                product['name'],
-                product['unit'],
-                product['base_price']
-            )
-            if product_id:
-                products_added += 1
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
 
-        importer.conn.commit()
-        importer.close()
+@app.route('/api/upload_status/<job_id>', methods=['GET'])
+def upload_status(job_id):
+    """PDF取り込みジョブの処理状況を取得"""
+    with _upload_jobs_lock:
+        job = _upload_jobs.get(job_id)
 
-        # アップロードファイルを削除
-        os.remove(filepath)
+        if job is None:
+            return jsonify({'success': False, 'error': 'ジョブが見つかりません'}), 404
 
-        return jsonify({
-            'success': True,
-            'customers_added': customers_added,
-            'products_added': products_added,
-            'customer_name': data.get('customer_name'),
-            'total_products': len(data['products'])
-        })
+        # 完了したジョブは結果を返した時点で破棄
+        if job['status'] == 'done':
+            _upload_jobs.pop(job_id, None)
+            _upload_finished_at.pop(job_id, None)
 
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)})
+    return jsonify(job)
 
 @app.route('/api/calculate_distance_price', methods=['POST'])
 def calculate_distance_price():
@@ -311,6 +517,7 @@ def set_product_distance_coefficient():
             coefficient=coefficient,
             adjustment_type=adjustment_type
         )
+        invalidate_list_cache('products')
 
         return jsonify({
             'success': True,
@@ -335,6 +542,7 @@ def set_category_distance_coefficient():
             coefficient=coefficient,
             adjustment_type=adjustment_type
         )
+        invalidate_list_cache('products')
 
         return jsonify({
             'success': True,
@@ -366,9 +574,7 @@ def get_product_pricing_info(product_id):
 
 def check_and_setup_data():
     """起動時にデータをチェックし、不足していれば自動セットアップ"""
-    import sqlite3
-    import glob
-    import os
+    init_services()
 
     print("\n" + "="*60)
     print("システム起動前チェック")
@@ -378,25 +584,27 @@ def check_and_setup_data():
     if not os.path.exists(DB_NAME):
         print("[!] データベースが見つかりません")
         print("[*] データベースを初期化します...\n")
-        from database_setup import EstimateDatabase
         db = EstimateDatabase(DB_NAME)
         db.connect()
-        db.create_tables()
+        with db.conn:
+            db.create_tables()
         db.close()
         print("[OK] データベース初期化完了\n")
+    else:
+        # 既存のデータベースにも追加テーブル・インデックスを作成
+        db = EstimateDatabase(DB_NAME)
+        db.connect()
+        with db.conn:
+            db.create_tables()
+        db.close()
 
-    # データ数をチェック
+    # データ数をチェック（以降のインポート処理でも同じ接続を使用）
+    conn = None
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
+        conn = get_db_connection()
 
-        cursor.execute("SELECT COUNT(*) FROM customers")
-        customer_count = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(*) FROM products")
-        product_count = cursor.fetchone()[0]
-
-        conn.close()
+        customer_count = conn.execute("SELECT COUNT(*) FROM customers").fetchone()[0]
+        product_count = conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
 
         print(f"[DATA] 現在のデータ: 顧客 {customer_count}件, 商品 {product_count}件\n")
 
@@ -411,32 +619,26 @@ def check_and_setup_data():
                 print(f"[PDF] {len(pdf_files)}件のPDFファイルを発見")
                 print("[*] PDFからデータをインポートします...\n")
 
-                from import_from_pdf import PDFEstimateImporter
-                importer = PDFEstimateImporter(DB_NAME)
-                importer.connect()
+                # PDF解析はCPU負荷が高いため、ファイル単位で複数プロセスに分散（ファイル数より多くは起動しない）
+                workers = min(os.cpu_count() or 1, len(pdf_files))
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    parsed_results = list(executor.map(parse_pdf_estimate_file, pdf_files))
 
-                for pdf_file in pdf_files:
-                    try:
-                        data = importer.parse_pdf_estimate(pdf_file)
-                        if data and data['customer_name']:
-                            importer.import_customer(data['customer_name'], data['address'])
-                        if data and data['products']:
-                            for product in data['products']:
-                                importer.import_product(product['name'], product['unit'], product['base_price'])
-                    except Exception as e:
-                        print(f"  [!] {os.path.basename(pdf_file)}: {e}")
+                # DB書き込みはメインプロセスで1トランザクションにまとめて実行
+                importer = PDFEstimateImporter(DB_NAME)
+                importer.connect(conn)
+                conn.execute('BEGIN IMMEDIATE')
 
-                importer.conn.commit()
-                importer.close()
+                try:
+                    importer.bulk_import(parsed_results)
+                    conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    print(f"  [!] PDFデータの登録に失敗: {e}")
 
                 # 最新のデータ数を確認
-                conn = sqlite3.connect(DB_NAME)
-                cursor = conn.cursor()
-                cursor.execute("SELECT COUNT(*) FROM customers")
-                customer_count = cursor.fetchone()[0]
-                cursor.execute("SELECT COUNT(*) FROM products")
-                product_count = cursor.fetchone()[0]
-                conn.close()
+                customer_count = conn.execute("SELECT COUNT(*) FROM customers").fetchone()[0]
+                product_count = conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
 
                 print(f"\n[OK] インポート完了: 顧客 {customer_count}件, 商品 {product_count}件\n")
 
@@ -471,6 +673,9 @@ def check_and_setup_data():
     except Exception as e:
         print(f"[!] エラー: {e}\n")
         print("データベースを初期化してください: python setup_system.py\n")
+    finally:
+        if conn:
+            conn.close()
 
 if __name__ == '__main__':
     # 起動前チェック
@@ -483,4 +688,11 @@ if __name__ == '__main__':
     print("アクセス: http://localhost:5000")
     print("\nCtrl+C で停止\n")
 
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # 本番用WSGIサーバー（waitress）でマルチスレッド起動
+    # Linuxでは gunicorn -w 4 -k gthread --threads 8 app:app でも起動可能
+    try:
+        from waitress import serve
+        serve(app, host='0.0.0.0', port=5000, threads=8)
+    except ImportError:
+        print("[警告] waitress が見つかりません。開発用サーバーで起動します（pip install waitress を推奨）")
+        app.run(debug=False, threaded=True, host='0.0.0.0', port=5000)
@@ -5,6 +5,31 @@ SQLiteを使用したデータベース構築
 import sqlite3
 from datetime import datetime
 
+# 接続時に適用するPRAGMA（WALにより書き込みごとのfsyncを削減）
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-64000",
+)
+
+# ジオコーディング結果キャッシュテーブル（GeocodingServiceからも作成する）
+GEOCODE_CACHE_TABLE_SQL = '''
+CREATE TABLE IF NOT EXISTS geocode_cache (
+    normalized_address TEXT PRIMARY KEY,
+    latitude REAL,
+    longitude REAL,
+    distance_km REAL,
+    cached_at TEXT DEFAULT (datetime('now', 'localtime'))
+)
+'''
+
+def apply_connection_pragmas(conn):
+    """SQLite接続に性能設定を適用"""
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+
 class EstimateDatabase:
     def __init__(self, db_name="estimate_system.db"):
         self.db_name = db_name
@@ -14,11 +39,12 @@ class EstimateDatabase:
     def connect(self):
         """データベースに接続"""
         self.conn = sqlite3.connect(self.db_name)
+        apply_connection_pragmas(self.conn)
         self.cursor = self.conn.cursor()
         print(f"[OK] データベースに接続しました: {self.db_name}")
 
     def create_tables(self):
-        """テーブルを作成"""
+        """テーブルを作成（コミットは呼び出し側の with self.conn: で行う）"""
 
         # 顧客情報テーブル
         self.cursor.execute('''
@@ -88,9 +114,28 @@ class EstimateDatabase:
         )
         ''')
 
-        self.conn.commit()
+        # ジオコーディング結果キャッシュテーブル（正規化した住所をキーとする）
+        self.cursor.execute(GEOCODE_CACHE_TABLE_SQL)
+
+        self.create_indexes()
+
         print("[OK] テーブルを作成しました")
 
+    def create_indexes(self):
+        """結合・検索に使うカラムのインデックスを作成"""
+        # SQLiteは外部キーに自動でインデックスを作成しないため明示的に作成
+        indexes = [
+            'CREATE INDEX IF NOT EXISTS idx_estimates_customer_id ON estimates(customer_id)',
+            'CREATE INDEX IF NOT EXISTS idx_estimates_created_at ON estimates(created_at DESC)',
+            'CREATE INDEX IF NOT EXISTS idx_details_estimate_id ON estimate_details(estimate_id)',
+            'CREATE INDEX IF NOT EXISTS idx_details_product_id ON estimate_details(product_id)',
+            'CREATE INDEX IF NOT EXISTS idx_customers_company_name ON customers(company_name)',
+            'CREATE INDEX IF NOT EXISTS idx_products_name ON products(product_name)',
+        ]
+
+        for sql in indexes:
+            self.cursor.execute(sql)
+
     def insert_sample_products(self):
         """サンプル商品データを挿入"""
         sample_products = [
@@ -108,21 +153,20 @@ class EstimateDatabase:
             INSERT INTO products (product_name, product_category, description, base_price, unit, notes)
             VALUES (?, ?, ?, ?, ?, ?)
         ''', sample_products)
-        self.conn.commit()
         print(f"[OK] サンプル商品データを{len(sample_products)}件挿入しました")
 
     def insert_sample_customer(self):
         """サンプル顧客データを挿入"""
         sample_customers = [
-            ('株式会社サンプル商事', 'カブシキガイシャサンプルショウジ', '100-0001', '東京都千代田区千代田1-1-1', None, None, None, '03-1234-5678', 'sample@example.com', '山田太郎'),
-            ('テスト株式会社', 'テストカブシキガイシャ', '530-0001', '大阪府大阪市北区梅田1-1-1', None, None, None, '06-1234-5678', 'test@example.com', '佐藤花子'),
+            ('株式会社サンプル商事', 'カブシキガイシャサンプルショウジ', '100-0001', '東京都千代田区千代田1-1-1', '03-1234-5678', 'sample@example.com', '山田太郎'),
+            ('テスト株式会社', 'テストカブシキガイシャ', '530-0001', '大阪府大阪市北区梅田1-1-1', '06-1234-5678', 'test@example.com', '佐藤花子'),
         ]
 
+        # 座標・距離は未設定のためカラムを指定せずテーブルの既定値(NULL)を使用
         self.cursor.executemany('''
-            INSERT INTO customers (company_name, company_name_kana, postal_code, address, latitude, longitude, distance_km, phone, email, contact_person)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO customers (company_name, company_name_kana, postal_code, address, phone, email, contact_person)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
         ''', sample_customers)
-        self.conn.commit()
         print(f"[OK] サンプル顧客データを{len(sample_customers)}件挿入しました")
 
     def display_tables(self):
@@ -145,10 +189,14 @@ def main():
 
     try:
         db.connect()
-        db.create_tables()
-        # サンプルデータは挿入しない（PDFからインポートするため）
-        # db.insert_sample_products()
-        # db.insert_sample_customer()
+
+        # テーブル作成とサンプル挿入を1トランザクションでまとめてコミット
+        with db.conn:
+            db.create_tables()
+            # サンプルデータは挿入しない（PDFからインポートするため）
+            # db.insert_sample_products()
+            # db.insert_sample_customer()
+
         db.display_tables()
     finally:
         db.close()
@@ -3,52 +3,140 @@
 商品ごとに距離に応じて見積価格を自動調整
 """
 import sqlite3
-from typing import Dict, Optional
+import sys
+import threading
+from typing import Dict, Optional, Sequence
+import numpy as np
+from database_setup import apply_connection_pragmas
 
 DB_NAME = "estimate_system.db"
 
+# 接続の文キャッシュ上限（既定の128と同じだが、ホットパスの文が確実に収まるよう明示）
+CACHED_STATEMENTS = 128
+
+# 調整額は整数の固定小数点で計算する（係数はppm、距離はナノメートル単位）
+# 距離をメートルに丸めると保存済みの距離（丸めていないfloat）で調整額が変わるため、
+# floatの有効桁を損なわない細かさで整数化する
+COEF_SCALE = 1_000_000
+DISTANCE_SCALE = 1_000_000_000_000
+FIXED_POINT_DIVISOR = COEF_SCALE * DISTANCE_SCALE
+
+# 調整タイプごとの調整額の符号（不明なタイプは調整なし）
+_SIGN = {
+    'fixed': 0,                   # 固定価格（距離による変動なし）
+    'distance_proportional': 1,   # 距離比例（遠いほど高い）
+    'distance_discount': -1,      # 距離割引（遠いほど安い）
+}
+
+def to_coef_ppm(coefficient: Optional[float]) -> int:
+    """距離係数（例: 0.025）をppm単位の整数（25000）に変換"""
+    return int(round((coefficient or 0.0) * COEF_SCALE))
+
+def fixed_point_adjustment(base_price: int, coef_ppm: int, distance_km: float) -> int:
+    """
+    基本単価 × 係数 × 距離 を整数演算で計算（0方向に切り捨て）
+
+    Args:
+        base_price: 基本単価（円）
+        coef_ppm: ppm単位の距離係数
+        distance_km: 距離 (km)
+    """
+    distance_nm = int(round(distance_km * DISTANCE_SCALE))
+    product = int(base_price) * coef_ppm * distance_nm
+    amount = abs(product) // FIXED_POINT_DIVISOR
+    return amount if product >= 0 else -amount
+
+# ホットパスのSQLはモジュール定数にして、同一文字列で文キャッシュにヒットさせる
+SQL_GET_PARAMS = '''
+    SELECT distance_coefficient, price_adjustment_type
+    FROM products
+    WHERE product_id = ?
+'''
+
+SQL_GET_ALL_PARAMS = '''
+    SELECT product_id, distance_coefficient, price_adjustment_type
+    FROM products
+'''
+
+# 他の接続（別プロセスを含む）がコミットするたびに値が変わる
+SQL_DATA_VERSION = 'PRAGMA data_version'
+
+SQL_GET_INFO = '''
+    SELECT product_name, base_price, unit, distance_coefficient, price_adjustment_type
+    FROM products
+    WHERE product_id = ?
+'''
+
+SQL_UPDATE_PRODUCT = '''
+    UPDATE products
+    SET distance_coefficient = ?, price_adjustment_type = ?
+    WHERE product_id = ?
+'''
+
+SQL_UPDATE_CATEGORY = '''
+    UPDATE products
+    SET distance_coefficient = ?, price_adjustment_type = ?
+    WHERE product_category = ?
+'''
+
 class DistancePricingService:
     """距離別価格調整サービス"""
 
     def __init__(self, db_name=DB_NAME):
         self.db_name = db_name
+        self._conn = None
+        # 接続はスレッド間で共有するため、トランザクション単位で排他する
+        self._lock = threading.RLock()
+        # 全商品の {商品ID: (係数, 調整タイプ, ppm係数)}（初回利用時に一括読み込み、設定変更時に破棄）
+        self._coef_cache = None
+        # 読み込み時のdata_version（他の接続がDBを更新したら読み直す）
+        self._coef_version = None
+
+    def _get_conn(self) -> sqlite3.Connection:
+        """永続接続を取得（初回のみ接続を開く）"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_name, check_same_thread=False,
+                                         cached_statements=CACHED_STATEMENTS)
+            apply_connection_pragmas(self._conn)
+        return self._conn
+
+    def close(self):
+        """永続接続を閉じる"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
 
     def add_distance_coefficient_column(self):
         """商品テーブルに距離係数カラムを追加"""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
+        conn = self._get_conn()
 
         try:
-            # 既にカラムが存在するかチェック
-            cursor.execute("PRAGMA table_info(products)")
-            columns = [col[1] for col in cursor.fetchall()]
-
-            if "distance_coefficient" not in columns:
-                cursor.execute('''
-                    ALTER TABLE products ADD COLUMN distance_coefficient REAL DEFAULT 0.0
-                ''')
-                conn.commit()
-                print("[OK] 距離係数カラムを追加しました")
-            else:
-                print("[INFO] 距離係数カラムは既に存在します")
-
-            # 調整タイプカラムも追加
-            cursor.execute("PRAGMA table_info(products)")
-            columns = [col[1] for col in cursor.fetchall()]
-
-            if "price_adjustment_type" not in columns:
-                cursor.execute('''
-                    ALTER TABLE products ADD COLUMN price_adjustment_type TEXT DEFAULT 'fixed'
-                ''')
-                conn.commit()
-                print("[OK] 価格調整タイプカラムを追加しました")
-            else:
-                print("[INFO] 価格調整タイプカラムは既に存在します")
+            with self._lock, conn:
+                cursor = conn.cursor()
+
+                # 既にカラムが存在するかチェック（両カラム分を1回で取得）
+                cursor.execute("PRAGMA table_info(products)")
+                columns = {col[1] for col in cursor.fetchall()}
+
+                if "distance_coefficient" not in columns:
+                    cursor.execute('''
+                        ALTER TABLE products ADD COLUMN distance_coefficient REAL DEFAULT 0.0
+                    ''')
+                    print("[OK] 距離係数カラムを追加しました")
+                else:
+                    print("[INFO] 距離係数カラムは既に存在します")
+
+                # 調整タイプカラムも追加
+                if "price_adjustment_type" not in columns:
+                    cursor.execute('''
+                        ALTER TABLE products ADD COLUMN price_adjustment_type TEXT DEFAULT 'fixed'
+                    ''')
+                    print("[OK] 価格調整タイプカラムを追加しました")
+                else:
+                    print("[INFO] 価格調整タイプカラムは既に存在します")
 
         except Exception as e:
             print(f"[エラー] カラム追加失敗: {e}")
-        finally:
-            conn.close()
 
     def set_product_distance_coefficient(self, product_id: int, coefficient: float,
                                         adjustment_type: str = 'distance_proportional'):
@@ -63,16 +151,13 @@ class DistancePricingService:
                 - 'distance_proportional': 距離比例（距離が遠いほど高くなる）
                 - 'distance_discount': 距離割引（距離が遠いほど安くなる）
         """
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
+        conn = self._get_conn()
 
         try:
-            cursor.execute('''
-                UPDATE products
-                SET distance_coefficient = ?, price_adjustment_type = ?
-                WHERE product_id = ?
-            ''', (coefficient, adjustment_type, product_id))
-            conn.commit()
+            with self._lock, conn:
+                cursor = conn.cursor()
+                cursor.execute(SQL_UPDATE_PRODUCT, (coefficient, adjustment_type, product_id))
+            self._coef_cache = None
 
             if cursor.rowcount > 0:
                 print(f"[OK] 商品ID {product_id} の距離係数を設定しました: {coefficient} ({adjustment_type})")
@@ -81,8 +166,6 @@ class DistancePricingService:
 
         except Exception as e:
             print(f"[エラー] 設定失敗: {e}")
-        finally:
-            conn.close()
 
     def calculate_adjusted_price(self, product_id: int, base_price: int,
                                  distance_km: float, quantity: int = 1) -> Dict:
@@ -98,17 +181,10 @@ class DistancePricingService:
         Returns:
             調整後の価格情報
         """
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            SELECT distance_coefficient, price_adjustment_type
-            FROM products
-            WHERE product_id = ?
-        ''', (product_id,))
-
-        result = cursor.fetchone()
-        conn.close()
+        try:
+            result = self._get_pricing_params(product_id)
+        except LookupError:
+            result = None
 
         if not result:
             # デフォルト（調整なし）
@@ -122,31 +198,27 @@ class DistancePricingService:
                 'distance_km': distance_km
             }
 
-        coefficient, adjustment_type = result
-
-        # 調整額を計算
-        adjustment_amount = 0
+        coefficient, adjustment_type, coef_ppm = result
+        sign = _SIGN.get(adjustment_type, 0)
 
-        if adjustment_type == 'fixed':
-            # 固定価格（調整なし）
-            adjusted_price = base_price
-
-        elif adjustment_type == 'distance_proportional':
-            # 距離比例（遠いほど高い）
-            adjustment_amount = int(base_price * coefficient * distance_km)
-            adjusted_price = base_price + adjustment_amount
-
-        elif adjustment_type == 'distance_discount':
-            # 距離割引（遠いほど安い）
-            adjustment_amount = -int(base_price * coefficient * distance_km)
-            adjusted_price = base_price + adjustment_amount
+        if not coef_ppm or not sign:
+            # 係数0・固定価格の商品は距離計算を省略
+            adjusted_price = max(base_price, 0)
+            return {
+                'base_price': base_price,
+                'adjusted_price': adjusted_price,
+                'adjustment_amount': 0,
+                'total_amount': adjusted_price * quantity,
+                'adjustment_type': adjustment_type,
+                'distance_km': distance_km,
+                'coefficient': coefficient
+            }
 
-        else:
-            # 不明な調整タイプ
-            adjusted_price = base_price
+        # 調整額を計算（符号は調整タイプから決定）
+        adjustment_amount = sign * fixed_point_adjustment(base_price, coef_ppm, distance_km)
 
         # 価格は0以下にならない
-        adjusted_price = max(adjusted_price, 0)
+        adjusted_price = max(base_price + adjustment_amount, 0)
 
         total_amount = adjusted_price * quantity
 
@@ -160,19 +232,127 @@ class DistancePricingService:
             'coefficient': coefficient
         }
 
-    def get_product_pricing_info(self, product_id: int) -> Optional[Dict]:
-        """商品の価格設定情報を取得"""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
+    def calculate_adjusted_price_batch(self, product_ids: Sequence[int], base_prices: Sequence[int],
+                                       distances: Sequence[float], quantities=1) -> np.ndarray:
+        """
+        複数の (商品, 距離) の組み合わせについて距離調整後の価格をまとめて計算
+
+        係数は1回のSELECTで取得し、計算はNumPy配列で一括処理する
+
+        Args:
+            product_ids: 商品IDの配列
+            base_prices: 基本単価の配列
+            distances: 距離 (km) の配列
+            quantities: 数量（配列またはスカラー）
+
+        Returns:
+            base_price, adjusted_price, adjustment_amount, total_amount,
+            distance_km, coefficient をフィールドに持つ構造化配列
+        """
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        base = np.asarray(base_prices, dtype=np.int64)
+        distance = np.asarray(distances, dtype=np.float64)
+        quantity = np.broadcast_to(np.asarray(quantities, dtype=np.int64), product_ids.shape)
+
+        unique_ids = [int(pid) for pid in np.unique(product_ids)]
+        params = {}
+
+        if unique_ids:
+            placeholders = ','.join('?' * len(unique_ids))
+            with self._lock:
+                rows = self._get_conn().execute(f'''
+                    SELECT product_id, distance_coefficient, price_adjustment_type
+                    FROM products
+                    WHERE product_id IN ({placeholders})
+                ''', unique_ids).fetchall()
+
+            params = {row[0]: (row[1] or 0.0, row[2]) for row in rows}
+
+        # 未登録の商品は調整なし（fixed）として扱う
+        coef = np.array([params.get(int(pid), (0.0, 'fixed'))[0] for pid in product_ids], dtype=np.float64)
+        types = np.array([params.get(int(pid), (0.0, 'fixed'))[1] for pid in product_ids], dtype=object)
+
+        sign = np.array([_SIGN.get(t, 0) for t in types], dtype=np.int64)
+
+        # 単価ごとの計算と同じ固定小数点演算
+        coef_ppm = np.rint(coef * COEF_SCALE).astype(np.int64)
+        adjustment = np.zeros(product_ids.shape, dtype=np.int64)
+
+        # 係数0・固定価格の行は計算対象から除外
+        mask = (coef_ppm != 0) & (sign != 0)
+        if mask.any():
+            distance_nm = np.rint(distance[mask] * DISTANCE_SCALE).astype(np.int64)
+            # 積はint64を超えるため、Pythonの整数（object配列）で計算する
+            product = base[mask].astype(object) * coef_ppm[mask].astype(object) * distance_nm.astype(object)
+            magnitude = np.abs(product) // FIXED_POINT_DIVISOR
+            adjustment[mask] = sign[mask] * np.where(product >= 0, magnitude, -magnitude).astype(np.int64)
+
+        adjusted = np.maximum(base + adjustment, 0)
+
+        result = np.empty(product_ids.shape, dtype=[
+            ('base_price', np.int64),
+            ('adjusted_price', np.int64),
+            ('adjustment_amount', np.int64),
+            ('total_amount', np.int64),
+            ('distance_km', np.float64),
+            ('coefficient', np.float64),
+        ])
+        result['base_price'] = base
+        result['adjusted_price'] = adjusted
+        result['adjustment_amount'] = adjustment
+        result['total_amount'] = adjusted * quantity
+        result['distance_km'] = distance
+        result['coefficient'] = coef
+
+        return result
+
+    def _load_coefs(self) -> Dict[int, tuple]:
+        """
+        全商品の距離係数と調整タイプを1回のSELECTで読み込む
+
+        他のプロセス（python distance_pricing.py など）が係数を更新した場合に備え、
+        data_versionが読み込み時から変わっていれば読み直す
+        """
+        with self._lock:
+            conn = self._get_conn()
+            version = conn.execute(SQL_DATA_VERSION).fetchone()[0]
+
+            if self._coef_cache is None or version != self._coef_version:
+                rows = conn.execute(SQL_GET_ALL_PARAMS).fetchall()
+                self._coef_cache = {row[0]: (row[1], row[2], to_coef_ppm(row[1])) for row in rows}
+                self._coef_version = version
+
+            return self._coef_cache
 
-        cursor.execute('''
-            SELECT product_name, base_price, unit, distance_coefficient, price_adjustment_type
-            FROM products
-            WHERE product_id = ?
-        ''', (product_id,))
+    def _get_pricing_params(self, product_id: int) -> tuple:
+        """
+        商品の距離係数・調整タイプ・ppm係数を取得
+
+        読み込み後に追加された商品のみDBを参照し、結果を辞書に追加する
+
+        Raises:
+            LookupError: 商品が存在しない場合
+        """
+        coefs = self._load_coefs()
+
+        result = coefs.get(product_id)
+        if result is not None:
+            return result
+
+        with self._lock:
+            result = self._get_conn().execute(SQL_GET_PARAMS, (product_id,)).fetchone()
+
+        if not result:
+            raise LookupError(product_id)
+
+        result = (result[0], result[1], to_coef_ppm(result[0]))
+        coefs[product_id] = result
+        return result
 
-        result = cursor.fetchone()
-        conn.close()
+    def get_product_pricing_info(self, product_id: int) -> Optional[Dict]:
+        """商品の価格設定情報を取得"""
+        with self._lock:
+            result = self._get_conn().execute(SQL_GET_INFO, (product_id,)).fetchone()
 
         if result:
             return {
@@ -195,37 +375,68 @@ class DistancePricingService:
             coefficient: 距離係数
             adjustment_type: 調整タイプ
         """
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
+        conn = self._get_conn()
 
         try:
-            cursor.execute('''
-                UPDATE products
-                SET distance_coefficient = ?, price_adjustment_type = ?
-                WHERE product_category = ?
-            ''', (coefficient, adjustment_type, category))
-            conn.commit()
+            with self._lock, conn:
+                cursor = conn.cursor()
+                cursor.execute(SQL_UPDATE_CATEGORY, (coefficient, adjustment_type, category))
+            self._coef_cache = None
 
             print(f"[OK] カテゴリ '{category}' の{cursor.rowcount}件の商品に距離係数を設定しました")
 
         except Exception as e:
             print(f"[エラー] 設定失敗: {e}")
-        finally:
-            conn.close()
+
+    def set_category_distance_coefficients(self, category_settings: Dict[str, tuple]) -> Dict[str, int]:
+        """
+        複数カテゴリの距離係数を1トランザクションで一括設定
+
+        Args:
+            category_settings: {カテゴリ: (係数, 調整タイプ, ...)} の辞書
+
+        Returns:
+            {カテゴリ: 更新件数} の辞書
+        """
+        conn = self._get_conn()
+        updated_counts = {}
+
+        try:
+            with self._lock, conn:
+                cursor = conn.cursor()
+                for category, (coefficient, adjustment_type, *_) in category_settings.items():
+                    cursor.execute(SQL_UPDATE_CATEGORY, (coefficient, adjustment_type, category))
+                    updated_counts[category] = cursor.rowcount
+            self._coef_cache = None
+
+        except Exception as e:
+            print(f"[エラー] 設定失敗: {e}")
+
+        return updated_counts
+
+def _flush_lines(lines: list):
+    """溜めた出力行をまとめて書き出す（1行ごとのprintによる書き込みを避ける）"""
+    if lines:
+        sys.stdout.write('\n'.join(lines) + '\n')
+        sys.stdout.flush()
+        lines.clear()
 
 def auto_setup_all_products():
     """全商品に距離係数を自動設定"""
     service = DistancePricingService()
+    lines = []
+    out = lines.append
 
-    print("\n" + "="*60)
-    print("商品カテゴリ別 距離係数自動設定")
-    print("="*60 + "\n")
+    out("\n" + "="*60)
+    out("商品カテゴリ別 距離係数自動設定")
+    out("="*60 + "\n")
 
-    # 1. カラム追加
+    # 1. カラム追加（サービス側の出力と順序が入れ替わらないよう先に書き出す）
+    _flush_lines(lines)
     service.add_distance_coefficient_column()
 
     # 2. 商品カテゴリ別に距離係数を設定
-    print("\n=== カテゴリ別距離係数の設定 ===\n")
+    out("\n=== カテゴリ別距離係数の設定 ===\n")
 
     # カテゴリごとの設定（係数が大きいほど距離の影響が大きい）
     category_settings = {
@@ -246,20 +457,23 @@ def auto_setup_all_products():
         'ソフトウェア': (0.0, 'fixed', 'ライセンス・オンライン納品のため距離無関係'),
     }
 
+    # 全カテゴリを1トランザクションで更新（カテゴリごとのコミットを避ける）
+    updated_counts = service.set_category_distance_coefficients(category_settings)
+
     for category, (coefficient, adj_type, description) in category_settings.items():
-        print(f"カテゴリ: {category}")
-        print(f"  係数: {coefficient} ({adj_type})")
-        print(f"  理由: {description}")
-        service.set_category_distance_coefficient(category, coefficient, adj_type)
-        print()
+        out(f"カテゴリ: {category}")
+        out(f"  係数: {coefficient} ({adj_type})")
+        out(f"  理由: {description}")
+        if category in updated_counts:
+            out(f"[OK] カテゴリ '{category}' の{updated_counts[category]}件の商品に距離係数を設定しました")
+        out('')
 
     # 3. 設定結果を確認
-    print("\n" + "="*60)
-    print("設定完了サマリー")
-    print("="*60 + "\n")
+    out("\n" + "="*60)
+    out("設定完了サマリー")
+    out("="*60 + "\n")
 
-    conn = sqlite3.connect(service.db_name)
-    cursor = conn.cursor()
+    cursor = service._get_conn().cursor()
 
     # カテゴリ別統計
     cursor.execute('''
@@ -273,10 +487,10 @@ def auto_setup_all_products():
         ORDER BY product_category
     ''')
 
-    print("カテゴリ別設定状況:")
+    out("カテゴリ別設定状況:")
     for row in cursor.fetchall():
         category, count, avg_coef, adj_type = row
-        print(f"  {category}: {count}件 (係数: {avg_coef:.3f}, {adj_type})")
+        out(f"  {category}: {count}件 (係数: {avg_coef:.3f}, {adj_type})")
 
     # 全体統計
     cursor.execute('SELECT COUNT(*) FROM products WHERE distance_coefficient > 0')
@@ -285,21 +499,25 @@ def auto_setup_all_products():
     cursor.execute('SELECT COUNT(*) FROM products')
     total_products = cursor.fetchone()[0]
 
-    print(f"\n距離調整有効: {distance_enabled}/{total_products}件")
+    out(f"\n距離調整有効: {distance_enabled}/{total_products}件")
+
+    service.close()
 
-    conn.close()
+    out("\n" + "="*60)
+    out("✅ 全商品の距離係数設定が完了しました！")
+    out("="*60 + "\n")
 
-    print("\n" + "="*60)
-    print("✅ 全商品の距離係数設定が完了しました！")
-    print("="*60 + "\n")
+    _flush_lines(lines)
 
 def show_price_examples():
     """価格計算例を表示"""
     service = DistancePricingService()
+    lines = []
+    out = lines.append
 
-    print("\n" + "="*60)
-    print("距離別価格シミュレーション")
-    print("="*60 + "\n")
+    out("\n" + "="*60)
+    out("距離別価格シミュレーション")
+    out("="*60 + "\n")
 
     # サンプル商品で計算
     examples = [
@@ -310,19 +528,27 @@ def show_price_examples():
 
     distances = [0, 5, 10, 20, 50]
 
-    for product_id, product_name, base_price in examples:
-        print(f"\n【{product_name}: ¥{base_price:,}】")
-        print("-" * 60)
-        print(f"{'距離':>6} | {'調整後価格':>12} | {'調整額':>12} | {'調整率':>8}")
-        print("-" * 60)
-
-        for distance in distances:
-            result = service.calculate_adjusted_price(product_id, base_price, distance, 1)
-            if result:
-                adjusted = result['adjusted_price']
-                adjustment = result['adjustment_amount']
-                rate = (adjustment / base_price * 100) if base_price > 0 else 0
-                print(f"{distance:4}km | ¥{adjusted:>10,} | ¥{adjustment:>+10,} | {rate:>+6.1f}%")
+    # 全商品×全距離の組み合わせを1回で計算
+    product_ids = np.repeat([e[0] for e in examples], len(distances))
+    base_prices = np.repeat([e[2] for e in examples], len(distances))
+    all_distances = np.tile(distances, len(examples))
+    results = service.calculate_adjusted_price_batch(product_ids, base_prices, all_distances)
+    results = results.reshape(len(examples), len(distances))
+
+    for (product_id, product_name, base_price), rows in zip(examples, results):
+        out(f"\n【{product_name}: ¥{base_price:,}】")
+        out("-" * 60)
+        out(f"{'距離':>6} | {'調整後価格':>12} | {'調整額':>12} | {'調整率':>8}")
+        out("-" * 60)
+
+        for distance, result in zip(distances, rows):
+            adjusted = int(result['adjusted_price'])
+            adjustment = int(result['adjustment_amount'])
+            rate = (adjustment / base_price * 100) if base_price > 0 else 0
+            out(f"{distance:4}km | ¥{adjusted:>10,} | ¥{adjustment:>+10,} | {rate:>+6.1f}%")
+
+    service.close()
+    _flush_lines(lines)
 
 def main():
     """メイン処理"""
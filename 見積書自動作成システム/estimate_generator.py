@@ -8,8 +8,19 @@ from reportlab.lib.units import mm
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 import os
 
+# ワーカープロセスごとの生成器（フォント登録はプロセス単位のため各プロセスで1回だけ行う）
+_worker_generator = None
+
+def _generate_estimate_worker(kwargs: dict) -> str:
+    """generate_estimates_batch用のワーカー関数"""
+    global _worker_generator
+    if _worker_generator is None:
+        _worker_generator = EstimateGenerator()
+    return _worker_generator.generate_estimate(**kwargs)
+
 class EstimateGenerator:
     """見積書生成クラス"""
 
@@ -20,6 +31,22 @@ class EstimateGenerator:
         # 出力ディレクトリを作成
         os.makedirs(self.output_dir, exist_ok=True)
 
+        # 明細表のレイアウト（座標は毎回計算せず事前に求めておく）
+        self._table_top = 220*mm
+        self._table_left = 20*mm
+        self._table_width = 170*mm
+        self._row_height = 7*mm
+        self._text_offset = 2*mm
+        self._col_widths = [10*mm, 80*mm, 15*mm, 15*mm, 25*mm, 25*mm]
+        self._col_positions = [self._table_left]
+
+        for width in self._col_widths[:-1]:
+            self._col_positions.append(self._col_positions[-1] + width)
+
+        # 左寄せ・右寄せ時の文字列のx座標
+        self._col_left_x = [x + 2*mm for x in self._col_positions]
+        self._col_right_x = [x + w - 2*mm for x, w in zip(self._col_positions, self._col_widths)]
+
         # 日本語フォントの登録（Windowsの標準フォント）
         try:
             font_path = "C:/Windows/Fonts/msgothic.ttc"
@@ -33,6 +60,14 @@ class EstimateGenerator:
             print(f"[警告] フォント登録エラー: {e}")
             self.font_name = 'Helvetica'
 
+        # フッターの固定文言は中央寄せ位置をプロセス内で1回だけ計算
+        self._footer_text = "本見積書は発行日より30日間有効です。"
+        self._footer_font_size = 7
+        self._footer_x = (
+            self.page_width - pdfmetrics.stringWidth(self._footer_text, self.font_name, self._footer_font_size)
+        ) / 2
+        self._footer_y = 15*mm
+
     def generate_estimate(
         self,
         customer_name: str,
@@ -86,6 +121,34 @@ class EstimateGenerator:
         print(f"[OK] 見積書を生成しました: {filename}")
         return filename
 
+    def generate_estimates_batch(self, estimates: list, max_workers: int = None) -> list:
+        """
+        複数の見積書PDFをプロセス並列で生成
+
+        Args:
+            estimates: generate_estimate のキーワード引数の辞書のリスト
+            max_workers: ワーカープロセス数（省略時はCPUコア数）
+
+        Returns:
+            生成したPDFファイルのパスのリスト（入力と同じ順序）
+        """
+        if not estimates:
+            return []
+
+        # 見積番号の既定値は秒単位のため、同一バッチ内でファイル名が重複しないよう連番を付与
+        timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        jobs = []
+        for index, kwargs in enumerate(estimates, 1):
+            kwargs = dict(kwargs)
+            if kwargs.get('estimate_number') is None:
+                kwargs['estimate_number'] = f"EST-{timestamp}-{index:03d}"
+            jobs.append(kwargs)
+
+        workers = min(max_workers or os.cpu_count() or 1, len(jobs))
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(_generate_estimate_worker, jobs))
+
     def _draw_header(self, c: canvas.Canvas, estimate_number: str, estimate_date: str):
         """ヘッダー部分を描画"""
         c.setFont(self.font_name, 20)
@@ -113,42 +176,64 @@ class EstimateGenerator:
     def _draw_items_table(self, c: canvas.Canvas, items: list) -> float:
         """見積明細表を描画"""
         # テーブルの開始位置
-        table_top = 220*mm
-        row_height = 7*mm
+        table_top = self._table_top
+        table_left = self._table_left
+        table_width = self._table_width
+        row_height = self._row_height
+        text_offset = self._text_offset
+        left_x = self._col_left_x
+        right_x = self._col_right_x
 
         # テーブルヘッダー
         c.setFont(self.font_name, 9)
         headers = ["No.", "品名・仕様", "数量", "単位", "単価", "金額"]
-        col_widths = [10*mm, 80*mm, 15*mm, 15*mm, 25*mm, 25*mm]
-        col_positions = [20*mm]
-
-        for width in col_widths[:-1]:
-            col_positions.append(col_positions[-1] + width)
 
         # ヘッダー描画
         c.setFillColorRGB(0.9, 0.9, 0.9)
-        c.rect(20*mm, table_top - row_height, 170*mm, row_height, fill=1)
+        c.rect(table_left, table_top - row_height, table_width, row_height, fill=1)
         c.setFillColorRGB(0, 0, 0)
 
         for i, header in enumerate(headers):
-            c.drawString(col_positions[i] + 2*mm, table_top - row_height + 2*mm, header)
+            c.drawString(left_x[i], table_top - row_height + text_offset, header)
+
+        # 明細行の文字列を事前に整形
+        rows = [
+            (
+                str(idx),
+                item.get('name', ''),
+                str(item.get('quantity', '')),
+                item.get('unit', ''),
+                f"￥{item.get('unit_price', 0):,}",
+                f"￥{item.get('amount', 0):,}",
+            )
+            for idx, item in enumerate(items, 1)
+        ]
+
+        # ループ内の属性参照を避けるためローカル変数に束縛
+        draw = c.drawString
+        draw_r = c.drawRightString
+        rect = c.rect
+        no_x, name_x, quantity_x, unit_x, price_x, amount_x = (
+            left_x[0], left_x[1], right_x[2], left_x[3], right_x[4], right_x[5]
+        )
 
         # 明細行の描画
         current_y = table_top - row_height
 
-        for idx, item in enumerate(items, 1):
+        for no, name, quantity, unit, unit_price, amount in rows:
             current_y -= row_height
+            text_y = current_y + text_offset
 
             # 罫線
-            c.rect(20*mm, current_y, 170*mm, row_height, fill=0)
+            rect(table_left, current_y, table_width, row_height, fill=0)
 
             # データ
-            c.drawString(col_positions[0] + 2*mm, current_y + 2*mm, str(idx))
-            c.drawString(col_positions[1] + 2*mm, current_y + 2*mm, item.get('name', ''))
-            c.drawRightString(col_positions[2] + 13*mm, current_y + 2*mm, str(item.get('quantity', '')))
-            c.drawString(col_positions[3] + 2*mm, current_y + 2*mm, item.get('unit', ''))
-            c.drawRightString(col_positions[4] + 23*mm, current_y + 2*mm, f"￥{item.get('unit_price', 0):,}")
-            c.drawRightString(col_positions[5] + 23*mm, current_y + 2*mm, f"￥{item.get('amount', 0):,}")
+            draw(no_x, text_y, no)
+            draw(name_x, text_y, name)
+            draw_r(quantity_x, text_y, quantity)
+            draw(unit_x, text_y, unit)
+            draw_r(price_x, text_y, unit_price)
+            draw_r(amount_x, text_y, amount)
 
         return current_y
 
@@ -173,13 +258,9 @@ class EstimateGenerator:
         c.drawString(20*mm, y_position - 5*mm, notes)
 
     def _draw_footer(self, c: canvas.Canvas):
-        """フッター部分を描画"""
-        c.setFont(self.font_name, 7)
-        c.drawCentredString(
-            self.page_width / 2,
-            15*mm,
-            "本見積書は発行日より30日間有効です。"
-        )
+        """フッター部分を描画（中央寄せの位置は事前計算済み）"""
+        c.setFont(self.font_name, self._footer_font_size)
+        c.drawString(self._footer_x, self._footer_y, self._footer_text)
 
 def main():
     """テスト用のメイン処理"""
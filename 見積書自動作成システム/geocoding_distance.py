@@ -5,9 +5,77 @@
 - 距離計算: ダイキョウクリーン様の拠点との距離を計算
 """
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import math
+import os
+import sqlite3
+import functools
+import unicodedata
 from typing import Optional, Tuple
+import numpy as np
+from database_setup import GEOCODE_CACHE_TABLE_SQL
+
+try:
+    import numba
+except ImportError:
+    # numbaが無い環境ではNumPyのベクトル演算で計算する
+    numba = None
+
+# 地球の楕円体パラメータ（GRS80）
+GRS80_A = 6378137.0  # 赤道半径（m）
+GRS80_B = 6356752.314140  # 極半径（m）
+GRS80_E2 = (GRS80_A**2 - GRS80_B**2) / GRS80_A**2  # 離心率の2乗
+
+def _hubeny_core_numpy(lats1, lons1, lats2, lons2):
+    """ヒュベニの公式で2点間の距離（km）を配列単位で計算（NumPy版）"""
+    lat1_rad, lon1_rad = np.radians(lats1), np.radians(lons1)
+    lat2_rad, lon2_rad = np.radians(lats2), np.radians(lons2)
+
+    lat_avg = (lat1_rad + lat2_rad) / 2
+    sin_sq = np.sin(lat_avg)**2
+
+    M = GRS80_A * (1 - GRS80_E2) / ((1 - GRS80_E2 * sin_sq)**1.5)
+    N = GRS80_A / np.sqrt(1 - GRS80_E2 * sin_sq)
+
+    delta_lat = lat1_rad - lat2_rad
+    delta_lon = lon1_rad - lon2_rad
+
+    return np.sqrt((delta_lat * M)**2 + (delta_lon * N * np.cos(lat_avg))**2) / 1000
+
+if numba is not None:
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _hubeny_core(lats1, lons1, lats2, lons2):
+        """ヒュベニの公式で2点間の距離（km）を配列単位で計算（numba版）"""
+        n = lats1.shape[0]
+        distances = np.empty(n)
+
+        for i in numba.prange(n):
+            lat1_rad = np.radians(lats1[i])
+            lat2_rad = np.radians(lats2[i])
+            lat_avg = (lat1_rad + lat2_rad) / 2
+            sin_sq = np.sin(lat_avg)**2
+
+            M = GRS80_A * (1 - GRS80_E2) / ((1 - GRS80_E2 * sin_sq)**1.5)
+            N = GRS80_A / np.sqrt(1 - GRS80_E2 * sin_sq)
+
+            delta_lat = lat1_rad - lat2_rad
+            delta_lon = np.radians(lons1[i]) - np.radians(lons2[i])
+
+            distances[i] = np.sqrt((delta_lat * M)**2 + (delta_lon * N * np.cos(lat_avg))**2) / 1000
+
+        return distances
+else:
+    _hubeny_core = _hubeny_core_numpy
+
+def normalize_address(address: str) -> str:
+    """
+    キャッシュキー用に住所を正規化
+
+    全角・半角を統一（NFKC）し、空白を除去して小文字化する
+    """
+    normalized = unicodedata.normalize('NFKC', address or '')
+    return ''.join(normalized.split()).lower()
 
 class GeocodingService:
     """ジオコーディングと距離計算を行うサービスクラス"""
@@ -16,9 +84,29 @@ class GeocodingService:
     BASE_LATITUDE = 35.6812
     BASE_LONGITUDE = 139.7671
 
-    def __init__(self):
+    def __init__(self, db_name: Optional[str] = None):
+        """
+        Args:
+            db_name: ジオコーディング結果を永続化するDB（geocode_cacheテーブル）。
+                     省略時はプロセス内キャッシュのみ
+        """
         self.houjin_api_url = "https://api.houjin-bangou.nta.go.jp/4/name"
         self.geocoding_api_url = "https://msearch.gsi.go.jp/address-search/AddressSearch"
+        self.db_name = db_name
+
+        # API呼び出しでTCP/TLS接続を使い回す（keep-alive）
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.session.mount('https://', adapter)
+
+        # 住所→座標のプロセス内キャッシュ（取得失敗は例外となるためキャッシュされない）
+        self._geocode_cached = functools.lru_cache(maxsize=4096)(self._lookup_coordinates)
+
+        # 登録済み顧客・キャッシュ済み住所の索引 {正規化住所: (緯度, 経度)}（初回検索時に読み込み）
+        self._address_index = None
+
+        # geocode_cacheテーブルを作成済みか（既存DBにテーブルが無い場合はここで作成する）
+        self._cache_table_ready = False
 
     def search_company_address(self, company_name: str) -> Optional[dict]:
         """
@@ -37,7 +125,7 @@ class GeocodingService:
                 'mode': '2',  # 前方一致
             }
 
-            response = requests.get(self.houjin_api_url, params=params, timeout=10)
+            response = self.session.get(self.houjin_api_url, params=params, timeout=10)
 
             if response.status_code == 200:
                 data = response.json()
@@ -67,12 +155,146 @@ class GeocodingService:
         Returns:
             (緯度, 経度) のタプル
         """
+        try:
+            return self._geocode_cached(address)
+        except LookupError:
+            return None
+
+    def _load_address_index(self) -> dict:
+        """座標が判明している住所（ジオコーディングキャッシュ・既存顧客）を索引に読み込む"""
+        index = {}
+
+        # DBが未作成の場合に空ファイルを作らないよう存在を確認してから接続
+        if os.path.exists(self.db_name):
+            conn = sqlite3.connect(self.db_name)
+            try:
+                self._ensure_cache_table(conn)
+
+                # 片方のテーブルが無くても、もう片方は索引に読み込む
+                try:
+                    for key, latitude, longitude in conn.execute('''
+                        SELECT normalized_address, latitude, longitude
+                        FROM geocode_cache
+                        WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+                    '''):
+                        index[key] = (latitude, longitude)
+                except sqlite3.Error as e:
+                    print(f"[警告] ジオコーディングキャッシュの読み込みに失敗: {e}")
+
+                try:
+                    for address, latitude, longitude in conn.execute('''
+                        SELECT address, latitude, longitude
+                        FROM customers
+                        WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+                    '''):
+                        index.setdefault(normalize_address(address), (latitude, longitude))
+                except sqlite3.Error as e:
+                    print(f"[警告] 顧客住所の読み込みに失敗: {e}")
+            finally:
+                conn.close()
+
+        self._address_index = index
+        return index
+
+    def _ensure_cache_table(self, conn):
+        """geocode_cacheテーブルが無ければ作成（create_tablesを経由しない起動経路向け）"""
+        if self._cache_table_ready:
+            return
+
+        try:
+            with conn:
+                conn.execute(GEOCODE_CACHE_TABLE_SQL)
+            self._cache_table_ready = True
+        except sqlite3.Error as e:
+            print(f"[警告] ジオコーディングキャッシュテーブルの作成に失敗: {e}")
+
+    def get_cached_coordinates(self, address: str) -> Optional[Tuple[float, float]]:
+        """
+        APIを呼ばずに、住所索引・ディスクキャッシュのみから座標を取得
+
+        Returns:
+            (緯度, 経度) のタプル（キャッシュに無い場合はNone）
+        """
+        if not self.db_name:
+            return None
+        return self._find_cached_coordinates(normalize_address(address))
+
+    def _find_cached_coordinates(self, cache_key: str) -> Optional[Tuple[float, float]]:
+        """正規化済み住所で住所索引・ディスクキャッシュを検索"""
+        # 既知の住所はDBを参照せずに返す
+        address_index = self._address_index
+        if address_index is None:
+            address_index = self._load_address_index()
+
+        if cache_key in address_index:
+            return address_index[cache_key]
+
+        try:
+            conn = sqlite3.connect(self.db_name)
+            try:
+                cached = conn.execute(
+                    'SELECT latitude, longitude FROM geocode_cache WHERE normalized_address = ?',
+                    (cache_key,)
+                ).fetchone()
+            finally:
+                conn.close()
+
+            if cached and cached[0] is not None and cached[1] is not None:
+                address_index[cache_key] = cached
+                return cached
+        except sqlite3.Error as e:
+            print(f"[警告] ジオコーディングキャッシュの読み込みに失敗: {e}")
+
+        return None
+
+    def _lookup_coordinates(self, address: str) -> Tuple[float, float]:
+        """
+        住所索引・ディスクキャッシュを確認し、無ければAPIで取得して書き戻す
+
+        Raises:
+            LookupError: 座標を取得できなかった場合
+        """
+        if not self.db_name:
+            return self._fetch_coordinates(address)
+
+        cache_key = normalize_address(address)
+
+        cached = self._find_cached_coordinates(cache_key)
+        if cached is not None:
+            return cached
+
+        latitude, longitude = self._fetch_coordinates(address)
+
+        try:
+            conn = sqlite3.connect(self.db_name)
+            try:
+                self._ensure_cache_table(conn)
+                with conn:
+                    conn.execute('''
+                        INSERT OR REPLACE INTO geocode_cache (normalized_address, latitude, longitude, distance_km)
+                        VALUES (?, ?, ?, ?)
+                    ''', (cache_key, latitude, longitude, self.get_distance_from_base(latitude, longitude)))
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"[警告] ジオコーディングキャッシュの書き込みに失敗: {e}")
+
+        self._address_index[cache_key] = (latitude, longitude)
+        return (latitude, longitude)
+
+    def _fetch_coordinates(self, address: str) -> Tuple[float, float]:
+        """
+        国土地理院APIを呼び出して座標を取得
+
+        Raises:
+            LookupError: 座標を取得できなかった場合
+        """
         try:
             params = {
                 'q': address
             }
 
-            response = requests.get(self.geocoding_api_url, params=params, timeout=10)
+            response = self.session.get(self.geocoding_api_url, params=params, timeout=10)
 
             if response.status_code == 200:
                 data = response.json()
@@ -86,11 +308,11 @@ class GeocodingService:
                         return (latitude, longitude)
             else:
                 print(f"[警告] ジオコーディングAPI呼び出しエラー: {response.status_code}")
-                return None
 
         except Exception as e:
             print(f"[エラー] 座標取得に失敗: {e}")
-            return None
+
+        raise LookupError(address)
 
     def calculate_distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
         """
@@ -112,14 +334,9 @@ class GeocodingService:
         # 平均緯度
         lat_avg = (lat1_rad + lat2_rad) / 2
 
-        # 地球の楕円体パラメータ（GRS80）
-        a = 6378137.0  # 赤道半径（m）
-        b = 6356752.314140  # 極半径（m）
-        e2 = (a**2 - b**2) / a**2  # 離心率の2乗
-
         # 子午線・卯酉線曲率半径
-        M = a * (1 - e2) / ((1 - e2 * math.sin(lat_avg)**2)**(3/2))
-        N = a / math.sqrt(1 - e2 * math.sin(lat_avg)**2)
+        M = GRS80_A * (1 - GRS80_E2) / ((1 - GRS80_E2 * math.sin(lat_avg)**2)**(3/2))
+        N = GRS80_A / math.sqrt(1 - GRS80_E2 * math.sin(lat_avg)**2)
 
         # 距離計算
         delta_lat = lat1_rad - lat2_rad
@@ -129,6 +346,34 @@ class GeocodingService:
 
         return distance / 1000  # kmに変換
 
+    def calculate_distance_batch(self, lats, lons, origin: Optional[Tuple[float, float]] = None) -> np.ndarray:
+        """
+        複数地点までの直線距離をまとめて計算（ヒュベニの公式・numba/NumPy版）
+
+        Args:
+            lats, lons: 対象地点の緯度・経度の配列
+            origin: 起点の (緯度, 経度)。省略時は拠点座標
+
+        Returns:
+            距離（km）の配列
+        """
+        if origin is None:
+            origin = (self.BASE_LATITUDE, self.BASE_LONGITUDE)
+
+        # カーネルは同じ長さの1次元配列を受け取るため、起点を対象地点の数に揃える
+        lats1, lons1, lats2, lons2 = np.broadcast_arrays(
+            np.float64(origin[0]), np.float64(origin[1]),
+            np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64)
+        )
+        shape = lats2.shape
+
+        distances = _hubeny_core(
+            np.ascontiguousarray(lats1.ravel()), np.ascontiguousarray(lons1.ravel()),
+            np.ascontiguousarray(lats2.ravel()), np.ascontiguousarray(lons2.ravel())
+        )
+
+        return distances.reshape(shape)
+
     def get_distance_from_base(self, latitude: float, longitude: float) -> float:
         """
         拠点からの距離を計算
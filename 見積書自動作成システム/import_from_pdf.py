@@ -1,12 +1,72 @@
 """
 見積書PDFファイルから顧客・商品情報を抽出してデータベースに登録
 """
+import pymupdf
 import pdfplumber
 import sqlite3
 import glob
+import hashlib
+import io
+import json
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
 from pathlib import Path
 
+from database_setup import apply_connection_pragmas
+
+try:
+    import ahocorasick
+except ImportError:
+    # pyahocorasickが無い環境ではキーワードを順に照合する
+    ahocorasick = None
+
+# 一括インポート時のみ追加で適用するPRAGMA（他プロセスからのアクセスを締め出してロック取得を省く）
+BULK_IMPORT_PRAGMAS = (
+    "PRAGMA locking_mode=EXCLUSIVE",
+)
+
+# PDF解析結果のキャッシュ（ファイル内容のハッシュをキーとする）
+# 解析処理の仕様を変えた場合はバージョンを上げて古いキャッシュを無効にする
+PARSE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "pdf_parse")
+PARSE_CACHE_VERSION = 1
+
+# 解析で繰り返し使う正規表現・キーワードはモジュール読み込み時に1回だけ用意する
+ADDRESS_PATTERN = re.compile(r'作業場所[︓:：\s]+(.+)')
+PRICE_STRIP_PATTERN = re.compile(r'[￥¥,円]')
+COMPANY_KEYWORDS = ('株式会社', '有限会社', '合同会社', '一般社団法人', '財団法人', '社団法人', '医療法人')
+ADDRESS_STOP_WORDS = ('作業日', '作業名', '項目')
+
+CATEGORY_KEYWORDS = {
+    'IT・開発': ['開発', 'システム', 'プログラム', 'API', 'サーバー', 'クラウド', 'SaaS', 'アプリ', 'Web', 'データベース', 'db', 'テスト', 'レビュー', '設計'],
+    'ネットワーク': ['ルーター', 'スイッチ', 'Wi-Fi', 'LAN', 'ネットワーク', 'ケーブル', 'HDMI'],
+    'ハードウェア': ['パソコン', 'PC', 'サーバ', 'モニター', 'プリンター', '複合機', 'タブレット', 'ノートPC', 'Laptop'],
+    'サービス': ['保守', 'メンテナンス', '作業', '支援', 'サポート', 'プラン', 'ライセンス', 'オンサイト', '運用'],
+    'ソフトウェア': ['Office', 'Microsoft', 'Google', 'Workspace', 'ソフトウェア', 'アプリケーション'],
+    '家電': ['冷蔵庫', '洗濯機', 'エアコン', '電子レンジ', 'テレビ'],
+    '家具': ['テーブル', '椅子', 'デスク', 'チェア', '棚'],
+}
+
+# (小文字化したキーワード, カテゴリ) の一覧（判定の優先順はCATEGORY_KEYWORDSの定義順）
+_CATEGORY_LOOKUP = tuple(
+    (keyword.lower(), category)
+    for category, keywords in CATEGORY_KEYWORDS.items()
+    for keyword in keywords
+)
+
+def _build_category_automaton():
+    """全キーワードを商品名の1回の走査で照合するオートマトンを作成"""
+    automaton = ahocorasick.Automaton()
+    for priority, (keyword, category) in enumerate(_CATEGORY_LOOKUP):
+        # 同じキーワードが複数ある場合は先に定義されたものを優先
+        if keyword not in automaton:
+            automaton.add_word(keyword, (priority, category))
+    automaton.make_automaton()
+    return automaton
+
+_CATEGORY_AUTOMATON = _build_category_automaton() if ahocorasick is not None else None
+
 class PDFEstimateImporter:
     """見積書PDFファイルからデータをインポート"""
 
@@ -15,9 +75,22 @@ class PDFEstimateImporter:
         self.conn = None
         self.cursor = None
 
-    def connect(self):
-        """データベースに接続"""
-        self.conn = sqlite3.connect(self.db_name)
+    def connect(self, conn=None, exclusive=False):
+        """
+        データベースに接続
+
+        Args:
+            conn: 既存の接続（指定した場合は新たに接続せずそれを使用）
+            exclusive: Trueの場合、一括インポート用に排他ロックモードで接続
+        """
+        if conn is not None:
+            self.conn = conn
+        else:
+            self.conn = sqlite3.connect(self.db_name)
+            apply_connection_pragmas(self.conn)
+            if exclusive:
+                for pragma in BULK_IMPORT_PRAGMAS:
+                    self.conn.execute(pragma)
         self.cursor = self.conn.cursor()
 
     def _safe_print(self, message):
@@ -28,14 +101,27 @@ class PDFEstimateImporter:
             safe_message = message.encode('cp932', errors='replace').decode('cp932')
             print(safe_message)
 
+    def _open_pymupdf(self, pdf_source):
+        """パスまたはバイト列からPyMuPDFのドキュメントを開く"""
+        if isinstance(pdf_source, (bytes, bytearray)):
+            return pymupdf.open(stream=pdf_source, filetype="pdf")
+        return pymupdf.open(pdf_source)
+
+    def _open_pdfplumber(self, pdf_source):
+        """パスまたはバイト列からpdfplumberのドキュメントを開く"""
+        if isinstance(pdf_source, (bytes, bytearray)):
+            return pdfplumber.open(io.BytesIO(pdf_source))
+        return pdfplumber.open(pdf_source)
+
     def extract_text_from_pdf(self, pdf_path):
         """PDFからテキストを抽出"""
         text_lines = []
 
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                for page in pdf.pages:
-                    text = page.extract_text()
+            # テキスト抽出はPyMuPDF（C実装）で行う
+            with self._open_pymupdf(pdf_path) as doc:
+                for page in doc:
+                    text = page.get_text("text")
                     if text:
                         text_lines.extend(text.split('\n'))
         except Exception as e:
@@ -45,16 +131,36 @@ class PDFEstimateImporter:
         return text_lines
 
     def parse_pdf_estimate(self, pdf_path):
-        """PDFから見積情報を解析"""
+        """
+        PDFから見積情報を解析
+
+        Args:
+            pdf_path: PDFファイルのパス、またはPDFのバイト列
+        """
         customer_name = None
         address = None
         products = []
 
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                for page in pdf.pages:
-                    text = page.extract_text()
-                    if text:
+            # ファイルは1回だけ読み込み、両ライブラリで同じバイト列を共有する
+            if isinstance(pdf_path, (bytes, bytearray)):
+                pdf_bytes = pdf_path
+            else:
+                pdf_bytes = Path(pdf_path).read_bytes()
+
+            # テキストはPyMuPDFで高速に抽出し、表の解析のみpdfplumberを使用
+            # pdfplumberは「品名」を含むページが見つかった時点で初めて開く
+            with self._open_pymupdf(pdf_bytes) as doc, ExitStack() as stack:
+                pdf = None
+                for page_index, text_page in enumerate(doc):
+                    text = text_page.get_text("text")
+
+                    # テキストを持たないページ（スキャン画像のみの表紙・添付など）は解析しない
+                    if not text.strip():
+                        continue
+
+                    # 宛先・作業場所を含むページのみ行単位で走査
+                    if '宛先' in text or '作業場所' in text:
                         lines = text.split('\n')
 
                         for i, line in enumerate(lines):
@@ -69,25 +175,33 @@ class PDFEstimateImporter:
                                         continue
 
                                     # 会社名のパターンをチェック
-                                    company_keywords = ['株式会社', '有限会社', '合同会社', '一般社団法人', '財団法人', '社団法人', '医療法人']
-                                    if any(keyword in next_line for keyword in company_keywords):
+                                    if any(keyword in next_line for keyword in COMPANY_KEYWORDS):
                                         customer_name = next_line
                                         break
 
                             # 作業場所から住所を抽出
                             if '作業場所' in line:
                                 # 「作業場所:」の後ろの住所を抽出
-                                address_match = re.search(r'作業場所[︓:：\s]+(.+)', line)
+                                address_match = ADDRESS_PATTERN.search(line)
                                 if address_match:
                                     address = address_match.group(1).strip()
                                 # 次の行も住所の可能性がある（改行されている場合）
                                 elif i + 1 < len(lines):
                                     next_line = lines[i + 1].strip()
-                                    if next_line and not any(x in next_line for x in ['作業日', '作業名', '項目']):
+                                    if next_line and not any(x in next_line for x in ADDRESS_STOP_WORDS):
                                         address = next_line
 
+                    # 明細表のヘッダー（品名）がないページは表の解析を省略
+                    if '品名' not in text:
+                        continue
+
                     # テーブルから商品情報を抽出
+                    if pdf is None:
+                        pdf = stack.enter_context(self._open_pdfplumber(pdf_bytes))
+                    page = pdf.pages[page_index]
                     tables = page.extract_tables()
+                    # 表を取り出したらページの解析キャッシュを解放（ページ数の多いPDFでメモリが膨らまないように）
+                    page.close()
                     for table in tables:
                         if not table:
                             continue
@@ -116,7 +230,7 @@ class PDFEstimateImporter:
                                 product_name = product_name.replace('\n', ' ').strip()
 
                                 # 単価の抽出
-                                price_cleaned = re.sub(r'[￥¥,円]', '', str(price_str))
+                                price_cleaned = PRICE_STRIP_PATTERN.sub('', str(price_str))
                                 try:
                                     base_price = int(float(price_cleaned))
                                 except ValueError:
@@ -144,7 +258,7 @@ class PDFEstimateImporter:
         }
 
     def import_customer(self, customer_name, address):
-        """顧客をデータベースに登録"""
+        """顧客をデータベースに登録（1件ずつ。複数PDFの一括登録は bulk_import を使用）"""
         if not customer_name:
             return None
 
@@ -156,18 +270,17 @@ class PDFEstimateImporter:
             self._safe_print(f"  [スキップ] 顧客は既に登録済み: {customer_name}")
             return existing[0]
 
-        # 新規登録
-        self.cursor.execute('''
+        # 新規登録（採番されたIDは同じ文で受け取る）
+        customer_id = self.cursor.execute('''
             INSERT INTO customers (company_name, address, phone, email)
             VALUES (?, ?, ?, ?)
-        ''', (customer_name, address, '', ''))
-
-        customer_id = self.cursor.lastrowid
+            RETURNING customer_id
+        ''', (customer_name, address, '', '')).fetchone()[0]
         self._safe_print(f"  [登録] 顧客: {customer_name}")
         return customer_id
 
     def import_product(self, product_name, unit, base_price):
-        """商品をデータベースに登録"""
+        """商品をデータベースに登録（1件ずつ。複数PDFの一括登録は bulk_import を使用）"""
         if not product_name or base_price <= 0:
             return None
 
@@ -189,34 +302,126 @@ class PDFEstimateImporter:
         # カテゴリを推測
         category = self._guess_category(product_name)
 
-        # 新規登録
-        self.cursor.execute('''
+        # 新規登録（採番されたIDは同じ文で受け取る）
+        product_id = self.cursor.execute('''
             INSERT INTO products (product_name, product_category, base_price, unit)
             VALUES (?, ?, ?, ?)
-        ''', (product_name, category, base_price, unit))
-
-        product_id = self.cursor.lastrowid
+            RETURNING product_id
+        ''', (product_name, category, base_price, unit)).fetchone()[0]
         self._safe_print(f"  [登録] 商品: {product_name} [{category}] - {base_price:,}円 / {unit}")
         return product_id
 
+    def bulk_import(self, parsed_results, labels=None):
+        """
+        解析済みの複数PDFの顧客・商品をまとめて登録
+
+        既存データは事前に一括取得して照合し、INSERT/UPDATEはexecutemanyでまとめて実行する。
+        トランザクションの開始・コミットは呼び出し側で行う
+
+        Args:
+            parsed_results: parse_pdf_estimate の結果のリスト
+            labels: 各結果の表示名（ファイル名など）のリスト
+
+        Returns:
+            {'customers': 処理した顧客数, 'products': 処理した商品数}
+        """
+        if labels is None:
+            labels = [None] * len(parsed_results)
+
+        # 既存の顧客名・商品を1回ずつ取得
+        self.cursor.execute('SELECT company_name FROM customers')
+        known_customers = {row[0] for row in self.cursor.fetchall()}
+
+        self.cursor.execute('SELECT product_id, product_name, base_price FROM products')
+        known_products = {name: [product_id, price] for product_id, name, price in self.cursor.fetchall()}
+
+        new_customers = []
+        new_products = {}  # 商品名 -> [カテゴリ, 単価, 単位]（登録順を保持）
+        price_updates = {}  # 既存商品ID -> (単価, 単位)
+        customers_processed = 0
+        products_processed = 0
+
+        for label, data in zip(labels, parsed_results):
+            if label:
+                self._safe_print(f"\n処理中: {label}")
+
+            if not data:
+                self._safe_print("  [警告] PDF解析に失敗しました")
+                continue
+
+            # 顧客
+            customer_name = data['customer_name']
+            if customer_name:
+                customers_processed += 1
+                if customer_name in known_customers:
+                    self._safe_print(f"  [スキップ] 顧客は既に登録済み: {customer_name}")
+                else:
+                    known_customers.add(customer_name)
+                    new_customers.append((customer_name, data['address'], '', ''))
+                    self._safe_print(f"  [登録] 顧客: {customer_name}")
+
+            # 商品
+            for product in data['products']:
+                product_name, unit, base_price = product['name'], product['unit'], product['base_price']
+                if not product_name or base_price <= 0:
+                    continue
+
+                products_processed += 1
+
+                if product_name in new_products:
+                    pending = new_products[product_name]
+                    if base_price > pending[1]:
+                        self._safe_print(f"  [更新] 商品: {product_name} ({pending[1]:,}円 -> {base_price:,}円)")
+                        pending[1], pending[2] = base_price, unit
+                    else:
+                        self._safe_print(f"  [スキップ] 商品は既に登録済み: {product_name}")
+
+                elif product_name in known_products:
+                    existing = known_products[product_name]
+                    if base_price > existing[1]:
+                        self._safe_print(f"  [更新] 商品: {product_name} ({existing[1]:,}円 -> {base_price:,}円)")
+                        existing[1] = base_price
+                        price_updates[existing[0]] = (base_price, unit)
+                    else:
+                        self._safe_print(f"  [スキップ] 商品は既に登録済み: {product_name}")
+
+                else:
+                    category = self._guess_category(product_name)
+                    new_products[product_name] = [category, base_price, unit]
+                    self._safe_print(f"  [登録] 商品: {product_name} [{category}] - {base_price:,}円 / {unit}")
+
+        # まとめて書き込み
+        if new_customers:
+            self.cursor.executemany('''
+                INSERT INTO customers (company_name, address, phone, email)
+                VALUES (?, ?, ?, ?)
+            ''', new_customers)
+
+        if price_updates:
+            self.cursor.executemany('''
+                UPDATE products SET base_price = ?, unit = ? WHERE product_id = ?
+            ''', [(price, unit, product_id) for product_id, (price, unit) in price_updates.items()])
+
+        if new_products:
+            self.cursor.executemany('''
+                INSERT INTO products (product_name, product_category, base_price, unit)
+                VALUES (?, ?, ?, ?)
+            ''', [(name, category, price, unit) for name, (category, price, unit) in new_products.items()])
+
+        return {'customers': customers_processed, 'products': products_processed}
+
     def _guess_category(self, product_name):
         """商品名からカテゴリを推測"""
-        categories = {
-            'IT・開発': ['開発', 'システム', 'プログラム', 'API', 'サーバー', 'クラウド', 'SaaS', 'アプリ', 'Web', 'データベース', 'db', 'テスト', 'レビュー', '設計'],
-            'ネットワーク': ['ルーター', 'スイッチ', 'Wi-Fi', 'LAN', 'ネットワーク', 'ケーブル', 'HDMI'],
-            'ハードウェア': ['パソコン', 'PC', 'サーバ', 'モニター', 'プリンター', '複合機', 'タブレット', 'ノートPC', 'Laptop'],
-            'サービス': ['保守', 'メンテナンス', '作業', '支援', 'サポート', 'プラン', 'ライセンス', 'オンサイト', '運用'],
-            'ソフトウェア': ['Office', 'Microsoft', 'Google', 'Workspace', 'ソフトウェア', 'アプリケーション'],
-            '家電': ['冷蔵庫', '洗濯機', 'エアコン', '電子レンジ', 'テレビ'],
-            '家具': ['テーブル', '椅子', 'デスク', 'チェア', '棚'],
-        }
-
         product_lower = product_name.lower()
 
-        for category, keywords in categories.items():
-            for keyword in keywords:
-                if keyword.lower() in product_lower:
-                    return category
+        if _CATEGORY_AUTOMATON is not None:
+            # 一致したキーワードのうち定義順が最も早いもののカテゴリを採用
+            match = min((value for _, value in _CATEGORY_AUTOMATON.iter(product_lower)), default=None)
+            return match[1] if match else 'その他'
+
+        for keyword, category in _CATEGORY_LOOKUP:
+            if keyword in product_lower:
+                return category
 
         return 'その他'
 
@@ -234,29 +439,20 @@ class PDFEstimateImporter:
         customers_imported = 0
         products_imported = 0
 
-        for filepath in files:
-            self._safe_print(f"\n処理中: {filepath}")
-
-            data = self.parse_pdf_estimate(filepath)
+        # PDF解析はCPU負荷が高いため複数プロセスに分散し、DB書き込みはこのプロセスのみで行う
+        workers = min(os.cpu_count() or 1, len(files))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parsed_results = list(executor.map(parse_pdf_estimate_file, files, chunksize=4))
 
-            if not data:
-                self._safe_print("  [警告] PDF解析に失敗しました")
-                continue
-
-            # 顧客を登録
-            if data['customer_name']:
-                self.import_customer(data['customer_name'], data['address'])
-                customers_imported += 1
-
-            # 商品を登録
-            for product in data['products']:
-                self.import_product(
-                    product['name'],
-                    product['unit'],
-                    product['base_price']
-                )
-                products_imported += 1
+        for data in parsed_results:
+            if data:
+                if data['customer_name']:
+                    customers_imported += 1
+                products_imported += len(data['products'])
 
+        # 全ファイル分の登録を1トランザクションでまとめて実行
+        self.conn.execute('BEGIN')
+        self.bulk_import(parsed_results, labels=files)
         self.conn.commit()
 
         self._safe_print(f"\n\n=== インポート完了 ===")
@@ -280,12 +476,57 @@ class PDFEstimateImporter:
         if self.conn:
             self.conn.close()
 
+def parse_pdf_estimate_file(pdf_path):
+    """
+    PDFを1件解析（ワーカープロセス用、DB接続は持たない）
+
+    内容が同じPDFは前回の解析結果をキャッシュから返す
+
+    Args:
+        pdf_path: PDFファイルのパス、またはPDFのバイト列
+    """
+    if isinstance(pdf_path, (bytes, bytearray)):
+        pdf_bytes = pdf_path
+    else:
+        try:
+            pdf_bytes = Path(pdf_path).read_bytes()
+        except OSError as e:
+            # 読めないファイルがあっても他のファイルの処理は続ける
+            print(f"[エラー] PDF読み込み失敗: {e}")
+            return None
+
+    digest = hashlib.sha1(pdf_bytes).hexdigest()
+    cache_path = os.path.join(PARSE_CACHE_DIR, f"{digest}.v{PARSE_CACHE_VERSION}.json")
+
+    try:
+        with open(cache_path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    result = PDFEstimateImporter().parse_pdf_estimate(pdf_bytes)
+
+    # 解析に失敗した場合は次回も再解析するためキャッシュしない
+    if result is not None:
+        try:
+            os.makedirs(PARSE_CACHE_DIR, exist_ok=True)
+            # 並列実行中の他プロセスが書きかけのファイルを読まないよう一時ファイル経由で置き換える
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"[警告] 解析結果のキャッシュ保存に失敗: {e}")
+
+    return result
+
 def main():
     """メイン処理"""
     importer = PDFEstimateImporter()
 
     try:
-        importer.connect()
+        # 単発の一括処理のため排他ロックで接続
+        importer.connect(exclusive=True)
 
         # pdf_estimatesフォルダ内のPDFファイルをインポート
         importer.import_all_pdfs("pdf_estimates/*.pdf")
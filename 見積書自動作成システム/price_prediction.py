@@ -5,20 +5,39 @@
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestRegressor
+from sklearn.ensemble import HistGradientBoostingRegressor
+from sklearn.inspection import permutation_importance
 from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
-import pickle
+import joblib
+import json
 import os
+import warnings
+
+# 金額の文字列から除去する記号（クォーテーション・カンマ・通貨記号）
+AMOUNT_STRIP_PATTERN = r'["¥￥,円]'
+
+# モデル保存時の圧縮設定（zlib レベル3）
+MODEL_COMPRESS = 3
+
+# モデルのバージョン（特徴量・前処理・推定器を変更したら上げ、保存済みモデルを作り直させる）
+MODEL_VERSION = 1
+
+# カテゴリ特徴量として扱えるクラス数の上限（HistGradientBoostingRegressorのmax_binsの上限値）
+MAX_CATEGORICAL_CLASSES = 255
 
 class PricePredictionModel:
     """価格予測モデルクラス"""
 
     def __init__(self):
-        self.model = RandomForestRegressor(n_estimators=100, random_state=42)
+        # ヒストグラム型の勾配ブースティング（特徴量を区間に離散化し、学習・予測ともにマルチスレッドで実行）
+        self.model = HistGradientBoostingRegressor(max_iter=200, learning_rate=0.05, random_state=42)
         self.label_encoders = {}
+        self.category_codes = {}  # カラム名 -> {値: コード}（単一予測時の辞書引き用）
         self.feature_columns = []
         self.model_path = "price_prediction_model.pkl"
+        # 学習に使ったCSVの情報（更新日時・サイズ）を保存するファイル
+        self.meta_path = os.path.splitext(self.model_path)[0] + ".meta.json"
 
     def prepare_data(self, df: pd.DataFrame) -> tuple:
         """
@@ -35,8 +54,8 @@ class PricePredictionModel:
 
         # 金額から数値のみを抽出（カンマや通貨記号を除去）
         if '金額' in data.columns:
-            # クォーテーションマークと通貨記号、カンマを除去
-            data['金額_数値'] = data['金額'].astype(str).str.replace('"', '').str.replace(',', '').str.replace('円', '').str.replace('¥', '').str.replace('￥', '').str.strip()
+            # クォーテーションマークと通貨記号、カンマを1回の正規表現置換でまとめて除去
+            data['金額_数値'] = data['金額'].astype(str).str.replace(AMOUNT_STRIP_PATTERN, '', regex=True).str.strip()
             data['金額_数値'] = pd.to_numeric(data['金額_数値'], errors='coerce')
 
         # 数量の数値変換
@@ -51,6 +70,8 @@ class PricePredictionModel:
                 data[f'{col}_encoded'] = le.fit_transform(data[col].astype(str))
                 self.label_encoders[col] = le
 
+        self._build_category_codes()
+
         # 特徴量の選択
         feature_cols = []
         if '数量_数値' in data.columns:
@@ -70,23 +91,73 @@ class PricePredictionModel:
 
         return X, y
 
-    def train(self, csv_file: str = '見積書データ.csv'):
+    def _build_category_codes(self):
+        """LabelEncoderのクラス一覧から値->コードの辞書を作成"""
+        self.category_codes = {
+            col: {value: code for code, value in enumerate(le.classes_)}
+            for col, le in self.label_encoders.items()
+        }
+
+    def _categorical_mask(self) -> list:
+        """特徴量ごとにカテゴリ特徴量として扱うかどうかを返す"""
+        mask = []
+        for col in self.feature_columns:
+            le = self.label_encoders.get(col[:-len('_encoded')]) if col.endswith('_encoded') else None
+            mask.append(le is not None and len(le.classes_) <= MAX_CATEGORICAL_CLASSES)
+        return mask
+
+    def _csv_signature(self, csv_file: str) -> dict:
+        """訓練データ・モデル設定の変更検知用の情報（パス・更新日時・サイズ・推定器とパラメータ）"""
+        stat = os.stat(csv_file)
+        # categorical_featuresは訓練データから決まるため比較対象から除く
+        params = {key: value for key, value in self.model.get_params().items() if key != 'categorical_features'}
+        return {
+            'csv_file': os.path.abspath(csv_file),
+            'mtime': stat.st_mtime,
+            'size': stat.st_size,
+            'model_version': MODEL_VERSION,
+            'estimator': type(self.model).__name__,
+            'params': repr(sorted(params.items())),
+        }
+
+    def _is_model_up_to_date(self, csv_signature: dict) -> bool:
+        """保存済みモデルが同じ訓練データから作成されたものかを確認"""
+        if not os.path.exists(self.model_path):
+            return False
+
+        try:
+            with open(self.meta_path, encoding='utf-8') as f:
+                return json.load(f) == csv_signature
+        except (OSError, ValueError):
+            return False
+
+    def train(self, csv_file: str = '見積書データ.csv', force: bool = False):
         """
         モデルの訓練
 
         Args:
             csv_file: 訓練データのCSVファイルパス
+            force: Trueの場合、訓練データに変更がなくても再訓練する
         """
         if not os.path.exists(csv_file):
             print(f"[エラー] データファイルが見つかりません: {csv_file}")
             return
 
+        # 訓練データが前回から変わっていなければ保存済みモデルを使用
+        csv_signature = self._csv_signature(csv_file)
+        if not force and self._is_model_up_to_date(csv_signature):
+            print(f"[INFO] 訓練データ・モデル設定に変更がないため保存済みモデルを使用します: {csv_file}")
+            if self.load_model():
+                return
+
         # データ読み込み
         df = pd.read_csv(csv_file, encoding='utf-8-sig')
         print(f"[OK] データ読み込み完了: {len(df)}件")
 
         # データ準備
         X, y = self.prepare_data(df)
+        # 列順はfeature_columnsで管理し、学習・予測ともNumPy配列で扱う
+        X = X.to_numpy(dtype=np.float64)
         print(f"[OK] 特徴量: {self.feature_columns}")
         print(f"[OK] 訓練データ数: {len(X)}件")
 
@@ -95,6 +166,10 @@ class PricePredictionModel:
             X, y, test_size=0.2, random_state=42
         )
 
+        # エンコード済みの列はカテゴリ特徴量として扱う（クラス数が上限を超える列は順序値のまま）
+        categorical_mask = self._categorical_mask()
+        self.model.set_params(categorical_features=categorical_mask if any(categorical_mask) else None)
+
         # モデル訓練
         print("\n[処理中] モデルを訓練しています...")
         self.model.fit(X_train, y_train)
@@ -111,10 +186,11 @@ class PricePredictionModel:
         print(f"二乗平均平方根誤差 (RMSE): {rmse:,.0f}円")
         print(f"決定係数 (R2): {r2:.3f}")
 
-        # 特徴量の重要度
+        # 特徴量の重要度（勾配ブースティングには不純度ベースの重要度がないため並べ替え重要度を使用）
+        importance = permutation_importance(self.model, X_test, y_test, n_repeats=5, random_state=42)
         feature_importance = pd.DataFrame({
             '特徴量': self.feature_columns,
-            '重要度': self.model.feature_importances_
+            '重要度': importance.importances_mean
         }).sort_values('重要度', ascending=False)
 
         print("\n=== 特徴量の重要度 ===")
@@ -123,6 +199,10 @@ class PricePredictionModel:
         # モデルを保存
         self.save_model()
 
+        # 次回の変更検知用に訓練データの情報を保存
+        with open(self.meta_path, 'w', encoding='utf-8') as f:
+            json.dump(csv_signature, f, ensure_ascii=False)
+
     def predict(self, product_name: str, quantity: int, company: str = None, distance_km: float = None) -> float:
         """
         価格を予測
@@ -142,33 +222,83 @@ class PricePredictionModel:
         # 数量
         features['数量_数値'] = quantity
 
-        # 商品名のエンコード
-        if '品名・仕様' in self.label_encoders:
-            le = self.label_encoders['品名・仕様']
-            try:
-                features['品名・仕様_encoded'] = le.transform([product_name])[0]
-            except ValueError:
-                # 未知の商品名の場合はデフォルト値
-                features['品名・仕様_encoded'] = 0
+        # 商品名のエンコード（未知の商品名の場合はデフォルト値0）
+        if '品名・仕様' in self.category_codes:
+            features['品名・仕様_encoded'] = self.category_codes['品名・仕様'].get(product_name, 0)
 
         # 会社名のエンコード
-        if company and '見積会社' in self.label_encoders:
-            le = self.label_encoders['見積会社']
-            try:
-                features['見積会社_encoded'] = le.transform([company])[0]
-            except ValueError:
-                features['見積会社_encoded'] = 0
+        if company and '見積会社' in self.category_codes:
+            features['見積会社_encoded'] = self.category_codes['見積会社'].get(company, 0)
         else:
             features['見積会社_encoded'] = 0
 
-        # DataFrameに変換
-        X = pd.DataFrame([features], columns=self.feature_columns)
+        # 1行分の配列に変換（DataFrameは生成しない）
+        X = np.array([[features.get(col, np.nan) for col in self.feature_columns]], dtype=np.float64)
 
         # 予測
-        predicted_price = self.model.predict(X)[0]
+        predicted_price = self._predict_array(X)[0]
 
         return predicted_price
 
+    def _encode_batch(self, column: str, values: list) -> np.ndarray:
+        """
+        カテゴリ値を一括でエンコード
+
+        Args:
+            column: エンコード対象のカラム名
+            values: 値のリスト
+
+        Returns:
+            エンコード済みの配列（未知の値は0）
+        """
+        # predict() と同じ値->コードの辞書で変換（未知の値・None等も0として扱う）
+        codes = self.category_codes.get(column)
+        if codes is None:
+            return np.zeros(len(values), dtype=np.int64)
+
+        return np.fromiter((codes.get(value, 0) for value in values), dtype=np.int64, count=len(values))
+
+    def predict_batch(self, product_names: list, quantities: list, company: str = None) -> np.ndarray:
+        """
+        複数商品の価格をまとめて予測（モデルの呼び出しは1回）
+
+        Args:
+            product_names: 商品名のリスト
+            quantities: 数量のリスト（product_names と同じ長さ）
+            company: 見積会社名（オプション）
+
+        Returns:
+            予測価格の配列
+        """
+        count = len(product_names)
+        if count == 0:
+            return np.empty(0)
+
+        features = {
+            '数量_数値': np.asarray(quantities, dtype=np.float32),
+            '品名・仕様_encoded': self._encode_batch('品名・仕様', product_names),
+        }
+
+        if company:
+            features['見積会社_encoded'] = self._encode_batch('見積会社', [company] * count)
+        else:
+            features['見積会社_encoded'] = np.zeros(count, dtype=np.int64)
+
+        X = np.column_stack([features[col] for col in self.feature_columns]).astype(np.float64, copy=False)
+
+        return self._predict_array(X)
+
+    def _predict_array(self, X: np.ndarray) -> np.ndarray:
+        """NumPy配列の特徴量でモデルの予測を実行"""
+        if not hasattr(self.model, 'feature_names_in_'):
+            return self.model.predict(X)
+
+        # DataFrameで学習した既存モデルは列名を保持しているため、NumPy配列で予測すると警告が出る
+        # 列順はfeature_columnsで管理しているので、この呼び出しの間だけ警告を抑制する
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', message='X does not have valid feature names', category=UserWarning)
+            return self.model.predict(X)
+
     def save_model(self):
         """モデルを保存"""
         model_data = {
@@ -177,8 +307,8 @@ class PricePredictionModel:
             'feature_columns': self.feature_columns
         }
 
-        with open(self.model_path, 'wb') as f:
-            pickle.dump(model_data, f)
+        # NumPy配列をバッファのまま圧縮して保存
+        joblib.dump(model_data, self.model_path, compress=MODEL_COMPRESS)
 
         print(f"\n[OK] モデルを保存しました: {self.model_path}")
 
@@ -188,12 +318,16 @@ class PricePredictionModel:
             print(f"[エラー] モデルファイルが見つかりません: {self.model_path}")
             return False
 
-        with open(self.model_path, 'rb') as f:
-            model_data = pickle.load(f)
+        # pickleで保存された既存のモデルファイルもそのまま読み込める
+        model_data = joblib.load(self.model_path)
 
         self.model = model_data['model']
+        # 並列設定なしで保存された既存のランダムフォレストモデルも全コアで予測する
+        if 'n_jobs' in self.model.get_params():
+            self.model.set_params(n_jobs=-1)
         self.label_encoders = model_data['label_encoders']
         self.feature_columns = model_data['feature_columns']
+        self._build_category_codes()
 
         print(f"[OK] モデルを読み込みました: {self.model_path}")
         return True
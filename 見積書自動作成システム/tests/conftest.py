@@ -0,0 +1,10 @@
+"""
+テスト共通設定
+
+アプリのモジュールは同じフォルダ内で相互に import しているため、
+見積書自動作成システムのフォルダを import パスに追加する
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,90 @@
+"""
+距離別価格調整のテスト
+"""
+import random
+
+import pytest
+
+from database_setup import EstimateDatabase
+from distance_pricing import DistancePricingService, fixed_point_adjustment, to_coef_ppm
+
+@pytest.fixture
+def pricing_service(tmp_path):
+    """係数・調整タイプの異なる商品を登録したDBのサービス"""
+    db_name = str(tmp_path / "estimate_system.db")
+    db = EstimateDatabase(db_name)
+    db.connect()
+    with db.conn:
+        db.create_tables()
+        db.cursor.executemany('''
+            INSERT INTO products (product_name, product_category, base_price, unit)
+            VALUES (?, ?, ?, ?)
+        ''', [(f'商品{i}', 'テスト', 1000 * (i + 1), '個') for i in range(6)])
+    db.close()
+
+    service = DistancePricingService(db_name)
+    service.add_distance_coefficient_column()
+    service.set_product_distance_coefficient(1, 0.02, 'distance_proportional')
+    service.set_product_distance_coefficient(2, 0.015, 'distance_discount')
+    service.set_product_distance_coefficient(3, 0.05, 'fixed')
+    service.set_product_distance_coefficient(4, 0.0, 'distance_proportional')
+    service.set_product_distance_coefficient(5, 0.033, 'distance_proportional')
+    # 商品6は既定値（係数0・fixed）のまま
+    yield service
+    service.close()
+
+@pytest.mark.parametrize("base_price, coefficient, distance_km, expected", [
+    (10000, 0.02, 15.5, 3100),
+    (10000, 0.02, 0.0, 0),
+    (5000, 0.015, 10, 750),
+    (3333, 0.033, 7.25, 797),  # 797.42... を切り捨て
+    (1972955, 0.033, 295.996505, 19271596),  # メートルに丸めると19271629になる
+])
+def test_fixed_point_adjustment(base_price, coefficient, distance_km, expected):
+    """固定小数点の調整額は 単価×係数×距離 を0方向に切り捨てた値"""
+    assert fixed_point_adjustment(base_price, to_coef_ppm(coefficient), distance_km) == expected
+    assert fixed_point_adjustment(base_price, -to_coef_ppm(coefficient), distance_km) == -expected
+
+def test_fixed_point_matches_float_formula():
+    """丸めていない距離でも以前の int(単価 × 係数 × 距離) と同じ調整額になる"""
+    rng = random.Random(0)
+    for _ in range(20000):
+        base_price = rng.randint(1, 2000000)
+        coefficient = rng.choice([0.005, 0.01, 0.015, 0.02, 0.025, 0.03, 0.033, 0.05, 0.1])
+        distance_km = rng.uniform(0, 1000)
+
+        expected = int(base_price * coefficient * distance_km)
+        assert fixed_point_adjustment(base_price, to_coef_ppm(coefficient), distance_km) == expected
+
+def test_batch_matches_single(pricing_service):
+    """一括計算は1件ずつの calculate_adjusted_price と同じ結果になる（未登録の商品を含む）"""
+    rng = random.Random(0)
+    product_ids = [rng.randint(1, 7) for _ in range(200)]
+    base_prices = [rng.randint(0, 2000000) for _ in range(200)]
+    distances = [rng.uniform(0, 1000) for _ in range(200)]
+    quantities = [rng.randint(1, 20) for _ in range(200)]
+
+    batch = pricing_service.calculate_adjusted_price_batch(product_ids, base_prices, distances, quantities)
+
+    for row, args in zip(batch, zip(product_ids, base_prices, distances, quantities)):
+        single = pricing_service.calculate_adjusted_price(*args)
+        assert row['adjusted_price'] == single['adjusted_price']
+        assert row['adjustment_amount'] == single['adjustment_amount']
+        assert row['total_amount'] == single['total_amount']
+
+def test_batch_empty(pricing_service):
+    """空の入力では空の結果を返す"""
+    assert len(pricing_service.calculate_adjusted_price_batch([], [], [])) == 0
+
+def test_coefficients_updated_by_another_connection(pricing_service):
+    """別の接続で変更した係数を再起動せずに反映する"""
+    before = pricing_service.calculate_adjusted_price(1, 10000, 10)
+    assert before['adjustment_amount'] == 2000
+
+    other = DistancePricingService(pricing_service.db_name)
+    other.set_product_distance_coefficient(1, 0.05, 'distance_discount')
+    other.close()
+
+    after = pricing_service.calculate_adjusted_price(1, 10000, 10)
+    assert after['adjustment_amount'] == -5000
+    assert after['adjustment_type'] == 'distance_discount'
@@ -0,0 +1,73 @@
+"""
+距離計算のテスト
+"""
+import random
+import sqlite3
+
+import numpy as np
+import pytest
+
+from geocoding_distance import GeocodingService
+
+@pytest.fixture
+def service():
+    return GeocodingService()
+
+def _random_points(count, seed=0):
+    """日本付近のランダムな地点"""
+    rng = random.Random(seed)
+    return [(rng.uniform(24.0, 46.0), rng.uniform(123.0, 146.0)) for _ in range(count)]
+
+def test_batch_matches_scalar(service):
+    """配列版のヒュベニ距離は1件ずつの calculate_distance と一致する"""
+    points = _random_points(500)
+    origin = (34.7025, 135.4959)
+
+    batch = service.calculate_distance_batch([p[0] for p in points], [p[1] for p in points], origin=origin)
+    single = [service.calculate_distance(origin[0], origin[1], lat, lon) for lat, lon in points]
+
+    np.testing.assert_allclose(batch, single, rtol=1e-9, atol=1e-9)
+
+def test_batch_default_origin_matches_distance_from_base(service):
+    """起点省略時は拠点からの距離（get_distance_from_base）と一致する"""
+    points = _random_points(100, seed=1)
+
+    batch = service.calculate_distance_batch([p[0] for p in points], [p[1] for p in points])
+    single = [service.get_distance_from_base(lat, lon) for lat, lon in points]
+
+    np.testing.assert_allclose(batch, single, rtol=1e-9, atol=1e-9)
+
+def test_batch_empty(service):
+    """空の配列では空の結果を返す"""
+    assert service.calculate_distance_batch([], []).shape == (0,)
+
+def test_cached_coordinates_without_geocode_cache_table(tmp_path):
+    """geocode_cacheテーブルが無いDBでも登録済み顧客の座標を返す"""
+    db_name = str(tmp_path / "estimate_system.db")
+    conn = sqlite3.connect(db_name)
+    with conn:
+        conn.execute('CREATE TABLE customers (address TEXT, latitude REAL, longitude REAL)')
+        conn.execute("INSERT INTO customers VALUES ('東京都千代田区1-1', 35.68, 139.76)")
+    conn.close()
+
+    service = GeocodingService(db_name=db_name)
+    assert service.get_cached_coordinates('東京都 千代田区1-1') == (35.68, 139.76)
+
+def test_geocode_cache_table_created_on_demand(tmp_path, monkeypatch):
+    """create_tablesを経由しないDBでも、取得した座標をgeocode_cacheに書き戻す"""
+    db_name = str(tmp_path / "estimate_system.db")
+    conn = sqlite3.connect(db_name)
+    with conn:
+        conn.execute('CREATE TABLE customers (address TEXT, latitude REAL, longitude REAL)')
+    conn.close()
+
+    service = GeocodingService(db_name=db_name)
+    monkeypatch.setattr(service, '_fetch_coordinates', lambda address: (34.70, 135.49))
+    assert service.geocode_address('大阪府大阪市北区1-1') == (34.70, 135.49)
+
+    conn = sqlite3.connect(db_name)
+    try:
+        cached = conn.execute('SELECT normalized_address, latitude, longitude FROM geocode_cache').fetchall()
+    finally:
+        conn.close()
+    assert cached == [('大阪府大阪市北区1-1', 34.70, 135.49)]
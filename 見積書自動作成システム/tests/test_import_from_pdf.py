@@ -0,0 +1,124 @@
+"""
+PDFインポートのテスト
+"""
+import sqlite3
+
+from database_setup import EstimateDatabase
+from import_from_pdf import PDFEstimateImporter
+
+# 解析済みPDFの例（重複・値上げ・値下げ・不正な行・解析失敗を含む）
+PARSED_RESULTS = [
+    {
+        'customer_name': '株式会社テスト',
+        'address': '東京都千代田区1-1',
+        'products': [
+            {'name': 'システム開発', 'unit': '式', 'base_price': 500000},
+            {'name': 'ノートPC', 'unit': '台', 'base_price': 150000},
+            {'name': '既存商品', 'unit': '個', 'base_price': 2000},
+            {'name': '', 'unit': '個', 'base_price': 100},
+            {'name': '無料サービス', 'unit': '回', 'base_price': 0},
+        ],
+    },
+    None,
+    {
+        'customer_name': '株式会社テスト',
+        'address': '東京都千代田区1-1',
+        'products': [
+            {'name': 'システム開発', 'unit': '人月', 'base_price': 600000},
+            {'name': 'ノートPC', 'unit': '台', 'base_price': 120000},
+            {'name': '既存商品', 'unit': '箱', 'base_price': 500},
+        ],
+    },
+    {
+        'customer_name': '既存顧客株式会社',
+        'address': '大阪府大阪市1-1',
+        'products': [
+            {'name': 'LANケーブル', 'unit': '本', 'base_price': 1200},
+        ],
+    },
+    {
+        'customer_name': None,
+        'address': None,
+        'products': [
+            {'name': 'LANケーブル', 'unit': '箱', 'base_price': 1500},
+        ],
+    },
+]
+
+def _create_db(path):
+    """テーブルを作成し、既存の顧客・商品を1件ずつ登録"""
+    db = EstimateDatabase(str(path))
+    db.connect()
+    with db.conn:
+        db.create_tables()
+        db.cursor.execute(
+            "INSERT INTO customers (company_name, address) VALUES ('既存顧客株式会社', '大阪府')"
+        )
+        db.cursor.execute(
+            "INSERT INTO products (product_name, product_category, base_price, unit) VALUES ('既存商品', 'その他', 1000, '個')"
+        )
+    db.close()
+    return str(path)
+
+def _dump(db_name):
+    """比較用に顧客・商品の内容を取得"""
+    conn = sqlite3.connect(db_name)
+    try:
+        customers = conn.execute(
+            'SELECT customer_id, company_name, address FROM customers ORDER BY customer_id'
+        ).fetchall()
+        products = conn.execute(
+            'SELECT product_id, product_name, product_category, base_price, unit FROM products ORDER BY product_id'
+        ).fetchall()
+    finally:
+        conn.close()
+    return customers, products
+
+def _import_one_by_one(importer, parsed_results):
+    """以前の import_all_pdfs と同じ1件ずつの登録"""
+    for data in parsed_results:
+        if not data:
+            importer._safe_print("  [警告] PDF解析に失敗しました")
+            continue
+        if data['customer_name']:
+            importer.import_customer(data['customer_name'], data['address'])
+        for product in data['products']:
+            importer.import_product(product['name'], product['unit'], product['base_price'])
+    importer.conn.commit()
+
+def test_bulk_import_matches_one_by_one(tmp_path, capsys):
+    """bulk_import は1件ずつの登録と同じ行・同じログを出力する"""
+    sequential_db = _create_db(tmp_path / "sequential.db")
+    bulk_db = _create_db(tmp_path / "bulk.db")
+    capsys.readouterr()
+
+    importer = PDFEstimateImporter(sequential_db)
+    importer.connect()
+    _import_one_by_one(importer, PARSED_RESULTS)
+    importer.close()
+    sequential_log = capsys.readouterr().out
+
+    importer = PDFEstimateImporter(bulk_db)
+    importer.connect()
+    importer.conn.execute('BEGIN')
+    counts = importer.bulk_import(PARSED_RESULTS)
+    importer.conn.commit()
+    importer.close()
+    bulk_log = capsys.readouterr().out
+
+    assert _dump(bulk_db) == _dump(sequential_db)
+    assert bulk_log == sequential_log
+    assert counts == {'customers': 3, 'products': 8}
+
+def test_bulk_import_empty(tmp_path):
+    """登録対象がなければ何も書き込まない"""
+    db_name = _create_db(tmp_path / "empty.db")
+    before = _dump(db_name)
+
+    importer = PDFEstimateImporter(db_name)
+    importer.connect()
+    assert importer.bulk_import([None]) == {'customers': 0, 'products': 0}
+    importer.conn.commit()
+    importer.close()
+
+    assert _dump(db_name) == before
@@ -0,0 +1,98 @@
+"""
+価格予測モデルのテスト
+"""
+import json
+import random
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from price_prediction import PricePredictionModel
+
+PRODUCTS = [f'商品{i}' for i in range(20)]
+COMPANIES = ['A社', 'B社', 'C社']
+
+@pytest.fixture(scope="module")
+def trained_model(tmp_path_factory):
+    """小さな合成データで訓練したモデル"""
+    workdir = tmp_path_factory.mktemp("model")
+    rng = random.Random(0)
+
+    rows = []
+    for _ in range(200):
+        product_index = rng.randrange(len(PRODUCTS))
+        quantity = rng.randint(1, 10)
+        rows.append({
+            '見積会社': rng.choice(COMPANIES),
+            '品名・仕様': PRODUCTS[product_index],
+            '数量': quantity,
+            '金額': f'"{(product_index + 1) * 1000 * quantity:,}円"',
+        })
+
+    csv_file = workdir / "見積書データ.csv"
+    pd.DataFrame(rows).to_csv(csv_file, index=False, encoding='utf-8-sig')
+
+    model = PricePredictionModel()
+    model.model_path = str(workdir / "model.pkl")
+    model.meta_path = str(workdir / "model.meta.json")
+    model.train(str(csv_file))
+    return model
+
+@pytest.mark.parametrize("company", [None, 'B社', '未登録の会社'])
+def test_predict_batch_matches_predict(trained_model, company):
+    """一括予測は1件ずつの予測と同じ結果になる（未知・未指定の商品名を含む）"""
+    names = [PRODUCTS[0], PRODUCTS[7], '未登録の商品', None, '', PRODUCTS[19]]
+    quantities = [1, 3, 2, 1, 5, 10]
+
+    batch = trained_model.predict_batch(names, quantities, company=company)
+    single = [trained_model.predict(name, quantity, company=company) for name, quantity in zip(names, quantities)]
+
+    np.testing.assert_allclose(batch, single)
+
+def test_predict_batch_empty(trained_model):
+    """空のリストでは空の配列を返す"""
+    assert trained_model.predict_batch([], []).shape == (0,)
+
+def _reload_model(trained_model, **params):
+    """訓練済みモデルと同じ保存先を使うモデル（パラメータを変更可能）"""
+    model = PricePredictionModel()
+    model.model_path = trained_model.model_path
+    model.meta_path = trained_model.meta_path
+    model.model.set_params(**params)
+    return model
+
+def test_retrain_skipped_only_for_same_model_settings(trained_model, capsys):
+    """訓練データが同じでも、推定器のパラメータが変われば再訓練する"""
+    with open(trained_model.meta_path, encoding='utf-8') as f:
+        csv_file = json.load(f)['csv_file']
+    skipped = '[INFO] 訓練データ・モデル設定に変更がないため'
+
+    capsys.readouterr()
+    _reload_model(trained_model).train(csv_file)
+    assert skipped in capsys.readouterr().out
+
+    _reload_model(trained_model, learning_rate=0.1).train(csv_file)
+    assert skipped not in capsys.readouterr().out
+
+def test_predict_with_dataframe_trained_model(trained_model):
+    """列名付きで学習した既存モデルでも警告を出さず、警告フィルタをプロセス全体に残さない"""
+    legacy = PricePredictionModel()
+    legacy.label_encoders = trained_model.label_encoders
+    legacy.category_codes = trained_model.category_codes
+    legacy.feature_columns = trained_model.feature_columns
+
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.integers(0, 10, size=(100, len(legacy.feature_columns))), columns=legacy.feature_columns)
+    legacy.model.fit(X, X.sum(axis=1) * 1000.0)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        legacy.predict(PRODUCTS[0], 2, company='A社')
+        legacy.predict_batch([PRODUCTS[0], PRODUCTS[1]], [1, 2])
+
+    assert not any(
+        message is not None and message.pattern.startswith('X does not have valid feature names')
+        for _, message, *_ in warnings.filters
+    )
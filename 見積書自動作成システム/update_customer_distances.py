@@ -2,10 +2,55 @@
 全顧客の座標・距離を自動計算・更新
 住所から座標を取得し、拠点からの距離を計算
 """
+import functools
 import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from database_setup import apply_connection_pragmas
 from geocoding_distance import GeocodingService
 import time
 
+DB_NAME = "estimate_system.db"
+
+# ジオコーディングAPIの呼び出し上限（回/秒）と同時実行数
+GEOCODING_CALLS_PER_SECOND = 1
+GEOCODING_WORKERS = 5
+
+class RateLimiter:
+    """全スレッド共通でAPI呼び出しの間隔を制御"""
+
+    def __init__(self, calls_per_second):
+        self._interval = 1.0 / calls_per_second
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def wait(self):
+        """次の呼び出し枠まで待機"""
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_time - now
+            self._next_time = max(now, self._next_time) + self._interval
+
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+def _geocode_customer(geocoding_service, rate_limiter, address):
+    """
+    1件の住所の座標を取得（ワーカースレッド用）
+
+    Returns:
+        (座標, 例外) のタプル
+    """
+    try:
+        # キャッシュ済みの住所はAPIを呼ばず、レート制限の待機も行わない
+        coordinates = geocoding_service.get_cached_coordinates(address)
+        if coordinates is None:
+            rate_limiter.wait()
+            coordinates = geocoding_service.geocode_address(address)
+        return coordinates, None
+    except Exception as e:
+        return None, e
+
 def update_all_customer_distances():
     """全顧客の座標・距離を自動更新"""
 
@@ -13,8 +58,10 @@ def update_all_customer_distances():
     print("顧客座標・距離の自動計算")
     print("="*60 + "\n")
 
-    geocoding_service = GeocodingService()
-    conn = sqlite3.connect("estimate_system.db")
+    # 取得結果はDBのgeocode_cacheに保存し、次回以降は同じ住所でAPIを呼ばない
+    geocoding_service = GeocodingService(db_name=DB_NAME)
+    conn = sqlite3.connect(DB_NAME)
+    apply_connection_pragmas(conn)
     cursor = conn.cursor()
 
     # 座標・距離が未設定の顧客を取得
@@ -35,43 +82,47 @@ def update_all_customer_distances():
 
     success_count = 0
     error_count = 0
-
-    for customer_id, company_name, address in customers_to_update:
+    updates = []
+
+    # API呼び出しは複数スレッドで並行して行い、呼び出し間隔はレート制限で全体として制御
+    rate_limiter = RateLimiter(GEOCODING_CALLS_PER_SECOND)
+    with ThreadPoolExecutor(max_workers=GEOCODING_WORKERS) as executor:
+        geocode = functools.partial(_geocode_customer, geocoding_service, rate_limiter)
+        results = list(executor.map(geocode, [address for _, _, address in customers_to_update]))
+
+    # 座標を取得できた顧客の拠点からの距離を配列でまとめて計算
+    located = [coordinates for coordinates, _ in results if coordinates]
+    distances = iter(geocoding_service.calculate_distance_batch(
+        [latitude for latitude, _ in located],
+        [longitude for _, longitude in located]
+    ).tolist())
+
+    for (customer_id, company_name, address), (coordinates, error) in zip(customers_to_update, results):
         print(f"処理中: {company_name}")
         print(f"  住所: {address}")
 
-        try:
-            # 住所から座標を取得
-            coordinates = geocoding_service.geocode_address(address)
-
-            if coordinates:
-                latitude, longitude = coordinates
-                distance_km = geocoding_service.get_distance_from_base(latitude, longitude)
-
-                # データベースを更新
-                cursor.execute('''
-                    UPDATE customers
-                    SET latitude = ?, longitude = ?, distance_km = ?
-                    WHERE customer_id = ?
-                ''', (latitude, longitude, distance_km, customer_id))
-
-                print(f"  ✅ 座標: ({latitude:.6f}, {longitude:.6f})")
-                print(f"  ✅ 距離: {distance_km:.1f} km\n")
-                success_count += 1
-
-                # APIレート制限対策（1秒待機）
-                time.sleep(1)
-
-            else:
-                print(f"  ❌ 座標の取得に失敗しました\n")
-                error_count += 1
-
-        except Exception as e:
-            print(f"  ❌ エラー: {e}\n")
+        if error is not None:
+            print(f"  ❌ エラー: {error}\n")
+            error_count += 1
+        elif coordinates:
+            latitude, longitude = coordinates
+            distance_km = next(distances)
+            updates.append((latitude, longitude, distance_km, customer_id))
+
+            print(f"  ✅ 座標: ({latitude:.6f}, {longitude:.6f})")
+            print(f"  ✅ 距離: {distance_km:.1f} km\n")
+            success_count += 1
+        else:
+            print(f"  ❌ 座標の取得に失敗しました\n")
             error_count += 1
 
-    conn.commit()
-    conn.close()
+    # データベースをまとめて更新
+    with conn:
+        cursor.executemany('''
+            UPDATE customers
+            SET latitude = ?, longitude = ?, distance_km = ?
+            WHERE customer_id = ?
+        ''', updates)
 
     # 結果サマリー
     print("="*60)
@@ -80,10 +131,7 @@ def update_all_customer_distances():
     print(f"\n成功: {success_count}件")
     print(f"失敗: {error_count}件\n")
 
-    # 最終確認
-    conn = sqlite3.connect("estimate_system.db")
-    cursor = conn.cursor()
-
+    # 最終確認（更新に使った接続をそのまま使用）
     cursor.execute('''
         SELECT
             COUNT(*) as total,